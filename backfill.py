@@ -0,0 +1,179 @@
+import csv
+import json
+import time
+import argparse
+import concurrent.futures
+
+from modules.audiovisual import search_movies_and_series
+from modules.book import search_book
+from modules.game import search_game
+from modules import client, config, metrics, notion, schedule, steps
+from modules.config import MAX_WORKERS, BACKFILL_BATCH_SIZE, HOST_CONNECTION_LIMITS, notion_headers
+from modules.writer import build_notion_payload
+
+MEDIA_TYPES = ["Movie", "TV Series", "Game", "Book"]
+
+def read_entries(path, default_type=None):
+    """
+    Read the titles to import from a CSV or JSON file
+
+    A CSV file needs a "title" (or "name") column and can have "type" and "release_date" columns. A JSON file is a
+    list of objects with the same keys, or of plain titles. Entries without a type get `default_type`.
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        rows = json.load(file) if path.lower().endswith(".json") else list(csv.DictReader(file))
+
+    types = {name.lower(): name for name in MEDIA_TYPES}
+    entries = []
+    for row in rows:
+        if isinstance(row, str):
+            row = {"title": row}
+        row = {key.strip().lower().replace(" ", "_"): value for key, value in row.items() if key}
+        title = str(row.get("title") or row.get("name") or "").strip()
+        media_type = types.get(str(row.get("type") or default_type or "").strip().lower())
+        if not title or not media_type:
+            print(f"Skipping {row}: no title or an unknown type (use one of {', '.join(MEDIA_TYPES)})")
+            continue
+        entries.append({"title": title, "type": media_type, "release_date": row.get("release_date") or None})
+    return entries
+
+def resolve(entry):
+    """
+    Search an entry in its source, returns its data or None if it wasn't found
+    """
+    try:
+        with metrics.timed("search"):
+            if entry["type"] == "Game":
+                result = steps.run(search_game(entry["title"], entry["release_date"]))
+            elif entry["type"] == "Book":
+                result = steps.run(search_book(entry["title"], entry["release_date"]))
+            else:
+                result = steps.run(search_movies_and_series(entry["title"], entry["type"], entry["release_date"]))
+    except Exception as e:
+        metrics.count("errors")
+        print(f"❌ Error processing '{entry['title']}': {e}")
+        return None
+    # Failed TMDB detail calls and Goodreads pages still return a body describing the error
+    if not result or "error" in result or result.get("success") is False:
+        return None
+    return result
+
+def page_body(entry):
+    """
+    Resolve an entry and return the body of the Notion page to create for it, and whether it was found
+
+    Entries that weren't found get a page with only their title and type, marked "Update: Yes" so the next run
+    searches them again.
+    """
+    result = resolve(entry)
+    if result:
+        try:
+            payload, img_body, _, _ = build_notion_payload(result, entry["type"])
+            body = {"properties": payload["properties"], "children": img_body["children"]}
+            if payload["cover"]:
+                body["cover"] = payload["cover"]
+            return {"parent": {"database_id": config.DATABASE_ID}, **body}, True
+        except Exception as e:
+            print(f"❌ Error processing '{entry['title']}': {e}")
+
+    properties = {
+        "Name":   {"title": [{"text": {"content": entry["title"]}}]},
+        "Type":   {"select": {"name": entry["type"]}},
+        "Update": {"select": {"name": "Yes"}},
+    }
+    return {"parent": {"database_id": config.DATABASE_ID}, "properties": properties, "children": []}, False
+
+def create_page(body):
+    """
+    Create a page in the database, returns True if Notion accepted it
+    """
+    with metrics.timed("write"):
+        response = client.post(notion.PAGES_URL, headers=notion_headers, json=body)
+    title = notion.property_value(body["properties"]["Name"])
+    if response.status_code != 200:
+        metrics.count("errors")
+        print(f"❌ Error creating '{title}': {response.status_code} {response.text}")
+        return False
+
+    page_id = response.json().get("id")
+    notion.remember_image_urls(page_id, [notion.block_url(child) for child in body["children"]])
+    schedule.mark_checked(page_id)
+    return True
+
+def backfill(path, default_type=None, batch_size=BACKFILL_BATCH_SIZE, dry_run=False, report=None):
+    """
+    Create a page for every title of a file that isn't in the database yet
+
+    Entries are resolved concurrently through the same searches as the update, a batch at a time, and the next batch
+    is resolved while the pages of the current one are created. Page creations have their own workers (as many as
+    the Notion connections), so they don't wait behind the searches of the next batch, and go through the Notion
+    rate limit of the client. Titles already in the database (before or after being resolved) and repeated titles are skipped, so
+    an interrupted backfill can simply be run again.
+    """
+    metrics.reset()
+    start_time = time.time()
+    entries = read_entries(path, default_type)
+    seen = notion.existing_page_keys(notion_headers)
+
+    todo = []
+    duplicates = 0
+    for entry in entries:
+        key = notion.page_key(entry["title"], entry["type"])
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        todo.append(entry)
+    print(f"{len(entries)} entries in {path}, {duplicates} already in the database or repeated, {len(todo)} to import.")
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    resolved = created = not_found = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=HOST_CONNECTION_LIMITS["api.notion.com"]) as creators:
+        futures = [executor.submit(page_body, entry) for entry in batches[0]] if batches else []
+        for number, batch in enumerate(batches, 1):
+            bodies = [future.result() for future in futures]
+            if number < len(batches):
+                futures = [executor.submit(page_body, entry) for entry in batches[number]]
+
+            to_create = []
+            for entry, (body, found) in zip(batch, bodies):
+                resolved += 1
+                not_found += not found
+                # The title found can be one the database already has under another spelling
+                key = notion.page_key(notion.property_value(body["properties"]["Name"]), entry["type"])
+                if key != notion.page_key(entry["title"], entry["type"]) and key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                to_create.append(body)
+
+            if dry_run:
+                for body in to_create:
+                    print(f"Would create '{notion.property_value(body['properties']['Name'])}'")
+            else:
+                created += sum(creators.map(create_page, to_create))
+
+            elapsed = time.time() - start_time
+            print(f"Batch {number}/{len(batches)}: {resolved}/{len(todo)} resolved, {created} created, "
+                  f"{not_found} not found, {duplicates} duplicates ({resolved / elapsed:.1f} entries/s)")
+
+    client.close()
+    metrics.count("created", created)
+    metrics.count("not_found", not_found)
+    metrics.count("duplicates", duplicates)
+    if report:
+        metrics.write_report(report)
+    print(f"Backfill done in {time.time() - start_time:.2f} seconds: {created} pages created, {not_found} of them "
+          f"not found and left for the next run to search again.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create Notion pages from a CSV or JSON list of titles")
+    parser.add_argument("path", help="CSV file with title, type and release_date columns, or a JSON list")
+    parser.add_argument("--type", choices=MEDIA_TYPES, help="type of the entries that don't have one")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE,
+                        help=f"entries resolved before their pages are created (default {BACKFILL_BATCH_SIZE})")
+    parser.add_argument("--dry-run", action="store_true", help="resolve the entries without creating any page")
+    parser.add_argument("--report", help="write the JSON report of the backfill (API calls, timings) to this file")
+    args = parser.parse_args()
+    backfill(args.path, default_type=args.type, batch_size=args.batch_size, dry_run=args.dry_run, report=args.report)
@@ -0,0 +1,80 @@
+"""
+Compare the parser backends for Goodreads book pages on saved HTML
+
+    python -m benchmarks.goodreads_parsing [pages.html ...] [--repeat 20]
+
+Without pages, benchmarks/fixtures/goodreads_book.html is used. To benchmark real pages, save a few book pages from
+the browser ("Save page as", HTML only) and pass them here. Every backend is checked to extract the same book
+information as the full html.parser parse.
+"""
+import os
+import time
+import argparse
+import tracemalloc
+
+from modules.bookscrapper import GoodreadsBookScraper, BOOK_SECTIONS
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "goodreads_book.html")
+
+BACKENDS = [
+    ("html.parser",             "html.parser", None),
+    ("html.parser + sections",  "html.parser", BOOK_SECTIONS),
+    ("lxml",                    "lxml",        None),
+    ("lxml + sections",         "lxml",        BOOK_SECTIONS),
+]
+
+
+def parse(html, parser, sections):
+    return GoodreadsBookScraper.parse_book_page(html, "https://www.goodreads.com/book/show/0", parser, sections)
+
+
+def measure(pages, repeat, parser, sections):
+    """
+    Returns:
+        The mean parse time per page in milliseconds, and the highest peak Python memory of a parse in MB
+        (tracemalloc does not see the memory lxml allocates in C)
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            parse(html, parser, sections)
+    elapsed = (time.perf_counter() - start) / (repeat * len(pages)) * 1000
+
+    peak = 0
+    for html in pages:
+        tracemalloc.start()
+        parse(html, parser, sections)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", default=[FIXTURE], help="Saved Goodreads book pages")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding="utf-8") as file:
+            pages.append(file.read())
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.0f} KB on average")
+
+    reference = [parse(html, "html.parser", None) for html in pages]
+    baseline = None
+    for name, backend, sections in BACKENDS:
+        try:
+            same = all(parse(html, backend, sections) == info for html, info in zip(pages, reference))
+        except Exception as e:  # lxml not installed
+            print(f"{name:<24} skipped ({e})")
+            continue
+
+        elapsed, peak = measure(pages, args.repeat, backend, sections)
+        baseline = baseline or elapsed
+        print(f"{name:<24} {elapsed:7.1f} ms/page ({baseline / elapsed:4.1f}x)  peak {peak:6.1f} MB  "
+              f"{'same result' if same else 'DIFFERENT RESULT'}")
+
+
+if __name__ == "__main__":
+    main()
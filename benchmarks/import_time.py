@@ -0,0 +1,71 @@
+"""
+Check that starting main.py stays fast: how long `import main` takes in a fresh interpreter, and which heavy
+dependencies it loads
+
+    python -m benchmarks.import_time [--budget 200] [--repeat 5] [--top 10]
+
+NumPy, BeautifulSoup, lxml, aiohttp and asyncio are only needed once a result is ranked, a book is parsed or the
+asyncio engine runs, so none of them should be imported up front. Exits with an error when one of them is, or when
+the median import time goes over the budget (in milliseconds).
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["numpy", "bs4", "lxml", "aiohttp", "asyncio", "difflib"]
+
+CHECK = f"""
+import sys
+import main
+print(",".join(name for name in {HEAVY!r} if name in sys.modules))
+"""
+
+
+def import_times():
+    """
+    Returns:
+        The cumulative import time of every module imported by main.py, in milliseconds, and the heavy modules that
+        were loaded
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHECK], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    heavy = [name for name in result.stdout.strip().split(",") if name]
+    return times, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=200, help="highest median import time allowed, in ms")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    median = statistics.median(times["main"] for times, _ in runs)
+    times, heavy = runs[-1]
+
+    print(f"import main: {median:.1f} ms (median of {args.repeat}, budget {args.budget:.0f} ms)")
+    for name, elapsed in sorted(times.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]:
+        print(f"  {elapsed:7.1f} ms  {name}")
+
+    failed = False
+    if heavy:
+        print(f"Imported up front: {', '.join(heavy)}")
+        failed = True
+    if median > args.budget:
+        print(f"Over the budget by {median - args.budget:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
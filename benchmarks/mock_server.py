@@ -0,0 +1,300 @@
+"""
+Local stand-in for Notion, TMDB, Twitch, IGDB, RAWG and Goodreads, replaying the fixtures in benchmarks/fixtures
+
+The project reaches it with API_BASE_URL=http://127.0.0.1:<port>, which sends every call to /<host>/<path>. The
+Notion database is synthetic (see make_database) and keeps the properties, covers and images written to it, so a
+second run sees the result of the first one.
+
+    python -m benchmarks.mock_server [--entries 1000] [--latency 0.05] [--error-rate 0.01] [--rate-limit notion=3]
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+TYPES    = ["Movie", "Movie", "Movie", "Movie", "TV Series", "TV Series", "Game", "Game", "Book", "Book"]
+FIRST_ID = 1000
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def make_database(size):
+    """
+    Notion pages of a synthetic database, with the type mix of TYPES and every page marked "Update: Yes"
+    """
+    pages = []
+    for i in range(size):
+        title = f"{TYPES[i % len(TYPES)]} Title {i}"
+        pages.append({
+            "object": "page",
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "last_edited_time": "2026-01-01T00:00:00.000Z",
+            "cover": None,
+            "properties": {
+                "Name":          {"type": "title", "title": [{"type": "text", "text": {"content": title},
+                                                              "plain_text": title}]},
+                "Type":          {"type": "select", "select": {"name": TYPES[i % len(TYPES)]}},
+                "Update":        {"type": "select", "select": {"name": "Yes"}},
+                "Status":        {"type": "select", "select": None},
+                "Release date":  {"type": "date", "date": None},
+                "Next air date": {"type": "date", "date": None},
+            },
+        })
+    return pages
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate    = rate
+        self.tokens  = rate
+        self.updated = time.monotonic()
+        self.lock    = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens  = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class MockAPIs:
+    """
+    Answers the requests of the project from the fixtures, with a latency, an error rate and rate limits per host
+    """
+    HOST_APIS = {
+        "api.notion.com":     "notion",
+        "api.themoviedb.org": "tmdb",
+        "id.twitch.tv":       "twitch",
+        "api.igdb.com":       "igdb",
+        "api.rawg.io":        "rawg",
+        "www.goodreads.com":  "goodreads",
+    }
+
+    def __init__(self, entries=100, latency=0.0, error_rate=0.0, rate_limits=None):
+        self.pages      = make_database(entries)
+        self.children   = {}
+        self.latency    = latency
+        self.error_rate = error_rate
+        self.buckets    = {api: TokenBucket(rate) for api, rate in (rate_limits or {}).items()}
+        self.lock       = threading.Lock()
+        self.requests   = {}
+
+    def request_updates(self):
+        """
+        Mark every page "Update: Yes" again, as if the user asked for all of them to be refreshed
+        """
+        with self.lock:
+            for page in self.pages:
+                page["properties"]["Update"] = {"type": "select", "select": {"name": "Yes"}}
+
+    def title(self, item_id):
+        index = int(item_id) - FIRST_ID
+        if 0 <= index < len(self.pages):
+            return self.pages[index]["properties"]["Name"]["title"][0]["plain_text"]
+        return f"Unknown {item_id}"
+
+    def item_id(self, title):
+        # IDs are the position of the page in the database, shifted by FIRST_ID
+        match = re.search(r'(\d+)\s*$', title or "")
+        return FIRST_ID + int(match.group(1)) if match else FIRST_ID
+
+    def render(self, name, item_id, title=None):
+        return (load_fixture(name).replace("__ID__", str(item_id))
+                                  .replace("__TITLE__", (title or self.title(item_id)).replace('"', '\\"')))
+
+    def handle(self, method, path, query, body):
+        """
+        Returns a (status, content type, body, headers) tuple
+        """
+        host, _, path = path.lstrip("/").partition("/")
+        path = "/" + path
+        api = self.HOST_APIS.get(host, host)
+        with self.lock:
+            self.requests[api] = self.requests.get(api, 0) + 1
+
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if api in self.buckets and not self.buckets[api].take():
+            return 429, "application/json", '{"message": "rate limited"}', {"Retry-After": "1"}
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, "application/json", '{"message": "unavailable"}', {}
+
+        handler = getattr(self, api, None) if api in self.HOST_APIS.values() else None
+        result = handler(method, path, query, body) if handler else None
+        if result is None:
+            return 404, "application/json", '{"message": "not found"}', {}
+        status, content = result
+        kind = "text/html" if content.lstrip().startswith("<") else "application/json"
+        return status, kind, content, {}
+
+    def notion(self, method, path, query, body):
+        if method == "POST" and path.endswith("/query"):
+            payload = json.loads(body or "{}")
+            start = int(payload.get("start_cursor") or 0)
+            end = start + min(int(payload.get("page_size", 100)), 100)
+            with self.lock:
+                results = self.pages[start:end]
+                data = {"object": "list", "results": results, "has_more": end < len(self.pages),
+                        "next_cursor": str(end) if end < len(self.pages) else None}
+                return 200, json.dumps(data)
+
+        if method == "POST" and path == "/v1/pages":
+            payload = json.loads(body or "{}")
+            with self.lock:
+                page = {"object": "page", "id": f"00000000-0000-0000-0000-{len(self.pages):012d}",
+                        "last_edited_time": "2026-01-01T00:00:00.000Z", "cover": payload.get("cover"),
+                        "properties": payload.get("properties", {})}
+                self.pages.append(page)
+                self.children[page["id"]] = payload.get("children", [])
+                return 200, json.dumps(page)
+
+        match = re.match(r'/v1/(pages|blocks)/([^/]+)(/children)?$', path)
+        if not match:
+            return None
+        kind, page_id, children = match.groups()
+        page = next((page for page in self.pages if page["id"] == page_id), None)
+        if not page:
+            return 404, '{"object": "error", "status": 404}'
+
+        with self.lock:
+            if kind == "blocks" and children and method == "GET":
+                return 200, json.dumps({"object": "list", "results": self.children.get(page_id, []),
+                                        "has_more": False, "next_cursor": None})
+            if kind == "blocks" and children and method == "PATCH":
+                self.children.setdefault(page_id, []).extend(json.loads(body or "{}").get("children", []))
+                return 200, json.dumps({"object": "list", "results": []})
+            if kind == "pages" and method == "PATCH":
+                payload = json.loads(body or "{}")
+                page["properties"].update(payload.get("properties", {}))
+                if "cover" in payload:
+                    page["cover"] = payload["cover"]
+                return 200, json.dumps(page)
+        return None
+
+    def tmdb(self, method, path, query, body):
+        if path.endswith("/changes"):
+            return 200, load_fixture("api/tmdb_changes.json")
+        match = re.match(r'/3/search/(movie|tv)$', path)
+        if match:
+            title = query.get("query", [""])[0]
+            return 200, self.render(f"api/tmdb_search_{match.group(1)}.json", self.item_id(title), title)
+        match = re.match(r'/3/(movie|tv)/(\d+)$', path)
+        if match:
+            return 200, self.render(f"api/tmdb_{match.group(1)}.json", match.group(2))
+        return None
+
+    def twitch(self, method, path, query, body):
+        return 200, load_fixture("api/twitch_token.json")
+
+    def igdb_games(self, query):
+        match = re.search(r'search "(.*?)";', query)
+        if match:
+            return json.loads(self.render("api/igdb_games.json", self.item_id(match.group(1)), match.group(1)))
+        match = re.search(r'where id = (\d+);', query)
+        if match:
+            return json.loads(self.render("api/igdb_games.json", match.group(1)))[:1]
+        return []
+
+    def igdb(self, method, path, query, body):
+        if path == "/v4/games":
+            return 200, json.dumps(self.igdb_games(body or ""))
+        if path == "/v4/multiquery":
+            queries = re.findall(r'query games "([^"]+)" \{(.*?)\};', body or "", re.S)
+            return 200, json.dumps([{"name": name, "result": self.igdb_games(games_query)}
+                                    for name, games_query in queries])
+        return None
+
+    def rawg(self, method, path, query, body):
+        if path == "/api/games":
+            title = query.get("search", [""])[0]
+            return 200, self.render("api/rawg_search.json", self.item_id(title), title)
+        match = re.match(r'/api/games/(\d+)$', path)
+        if match:
+            return 200, self.render("api/rawg_game.json", match.group(1))
+        return None
+
+    def goodreads(self, method, path, query, body):
+        if path == "/search":
+            title = query.get("q", [""])[0]
+            return 200, self.render("api/goodreads_search.html", self.item_id(title), title)
+        if path.startswith("/book/show/"):
+            return 200, load_fixture("goodreads_book.html")
+        return None
+
+
+def make_handler(apis):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def respond(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8") if length else None
+            status, kind, content, headers = apis.handle(self.command, parts.path, parse_qs(parts.query), body)
+
+            data = content.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{kind}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = respond
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start(apis, port=0):
+    """
+    Serve the mock APIs on a background thread, returns the server (its address is server.server_address)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(apis))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-server", daemon=True).start()
+    return server
+
+
+def parse_rate_limits(values):
+    return {api: float(rate) for api, rate in (value.split("=") for value in values or [])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--entries", type=int, default=100, help="pages in the synthetic Notion database")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--rate-limit", nargs="*", metavar="API=RATE",
+                        help="requests per second accepted by an API before answering 429 (e.g. notion=3)")
+    args = parser.parse_args()
+
+    apis = MockAPIs(args.entries, args.latency, args.error_rate, parse_rate_limits(args.rate_limit))
+    server = start(apis, args.port)
+    print(f"Serving on http://127.0.0.1:{server.server_address[1]}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Run the whole update against the local mock APIs (benchmarks/mock_server.py) and report its throughput
+
+    python -m benchmarks.pipeline [--sizes 100 1000 10000] [--engine thread|async|both] [--latency 0.05]
+                                  [--error-rate 0.01] [--rate-limit notion=3] [--client-rate 50] [--warm]
+
+For each database size, main.py runs in a subprocess with a fresh state directory and every API sent to the mock
+server. The numbers come from the report of the run: entries per second, and the p50 and p95 time of an entry from
+the start of its search to the end of its write. The time it waited for a worker (the queue_wait stage) or for its
+IGDB batch isn't counted. With --warm, every page is marked "Update: Yes" again and a second run reuses the state
+(cache, memo, tokens) of the first one.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks import mock_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APIS = ["notion", "tmdb", "igdb", "twitch", "rawg", "goodreads"]
+
+
+def run_main(engine, state_dir, base_url, client_rate, goodreads_gap):
+    """
+    Run main.py against the mock server, returns the report of the run and its wall time
+    """
+    env = {
+        **os.environ,
+        "API_BASE_URL":       base_url,
+        "STATE_DIR":          state_dir,
+        "DATABASE_ID":        "bench",
+        "NOTION_TOKEN":       "bench",
+        "TMDB_API_KEY":       "bench",
+        "RAWG_API_KEY":       "bench",
+        "IGDB_CLIENT_ID":     "bench",
+        "IGDB_CLIENT_SECRET": "bench",
+        "GOODREADS_MIN_GAP":  str(goodreads_gap),
+        **{f"RATE_LIMIT_{api.upper()}": str(client_rate) for api in APIS},
+    }
+    report = os.path.join(state_dir, "report.json")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--engine", engine, "--report", report], cwd=ROOT, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - start
+    with open(report) as file:
+        return json.load(file), elapsed
+
+
+def summary_line(label, size, data, elapsed):
+    entry = data["stages"].get("entry", {"count": 0, "p50": 0.0, "p95": 0.0})
+    calls = sum(api["calls"] for api in data["apis"].values())
+    hits = sum(api["cache_hits"] for api in data["apis"].values())
+    errors = data["counts"].get("errors", 0)
+    return (f"{label:<14} {size:>7} {entry['count']:>7} {entry['count'] / elapsed:>9.1f} "
+            f"{entry['p50'] * 1000:>9.0f} {entry['p95'] * 1000:>9.0f} {calls:>8} {hits:>8} {errors:>7} {elapsed:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="pages in the database")
+    parser.add_argument("--engine", choices=["thread", "async", "both"], default="both")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean seconds the mock APIs take to answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--rate-limit", nargs="*", metavar="API=RATE",
+                        help="requests per second the mock APIs accept before answering 429 (e.g. notion=3)")
+    parser.add_argument("--client-rate", type=float, default=50,
+                        help="requests per second the project allows itself for every API (RATE_LIMIT_<API>)")
+    parser.add_argument("--goodreads-gap", type=float, default=0.0, help="GOODREADS_MIN_GAP of the runs")
+    parser.add_argument("--warm", action="store_true", help="run each size a second time on the same state")
+    args = parser.parse_args()
+
+    engines = ["thread", "async"] if args.engine == "both" else [args.engine]
+    print(f"{'run':<14} {'pages':>7} {'entries':>7} {'entries/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'calls':>8} {'cached':>8} {'errors':>7} {'wall s':>8}")
+    for size in args.sizes:
+        for engine in engines:
+            apis = mock_server.MockAPIs(size, args.latency, args.error_rate,
+                                        mock_server.parse_rate_limits(args.rate_limit))
+            server = mock_server.start(apis)
+            base_url = f"http://127.0.0.1:{server.server_address[1]}"
+            try:
+                with tempfile.TemporaryDirectory() as state_dir:
+                    runs = ["cold", "warm"] if args.warm else ["cold"]
+                    for run in runs:
+                        if run == "warm":
+                            apis.request_updates()
+                        data, elapsed = run_main(engine, state_dir, base_url, args.client_rate, args.goodreads_gap)
+                        print(summary_line(f"{engine} {run}", size, data, elapsed))
+            finally:
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == "__main__":
+    main()
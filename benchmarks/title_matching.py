@@ -0,0 +1,68 @@
+"""
+Compare the title matcher used by choose_best_result with the original difflib implementation
+
+    python -m benchmarks.title_matching [--cases cases.json] [--repeat 200]
+
+cases.json is a list of [target title, [candidate titles...]], for example the titles of saved TMDB/IGDB searches.
+Without it, a small built-in sample is used.
+"""
+import json
+import time
+import argparse
+
+from modules import matching
+
+SAMPLE_CASES = [
+    ["Dune", ["Dune", "Dune: Part Two", "Dune", "Children of Dune", "Frank Herbert's Dune", "Jodorowsky's Dune"]],
+    ["The Office", ["The Office", "The Office (US)", "Office Space", "The Office Mix", "Back to the Office"]],
+    ["Hades", ["Hades", "Hades II", "Hades' Star", "Hadean Lands", "The Hades Project"]],
+    ["Percy Jackson and the Lightning Thief", ["Percy Jackson & the Olympians: The Lightning Thief",
+                                              "Percy Jackson: Sea of Monsters", "The Lightning Thief",
+                                              "Percy Jackson and the Olympians"]],
+    ["O Auto da Compadecida", ["O Auto da Compadecida", "O Auto da Compadecida 2", "A Compadecida"]],
+    ["Severance", ["Severance", "Severance Pay", "The Severance", "Sever"]],
+    ["Spider-Man: Into the Spider-Verse", ["Spider-Man: Into the Spider-Verse", "Spider-Man: Across the Spider-Verse",
+                                           "Spider-Man", "Spider-Man: Beyond the Spider-Verse"]],
+    ["The Legend of Zelda: Breath of the Wild", ["The Legend of Zelda: Breath of the Wild",
+                                                 "The Legend of Zelda: Tears of the Kingdom",
+                                                 "The Legend of Zelda", "Zelda II: The Adventure of Link"]],
+]
+
+
+def time_scorer(cases, repeat, score):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for target, candidates in cases:
+            score(target, candidates)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", help="JSON file with [target, [candidates...]] pairs")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = SAMPLE_CASES
+    if args.cases:
+        with open(args.cases) as file:
+            cases = json.load(file)
+
+    agreement = matching.ranking_agreement(cases)
+    print(f"{agreement['cases']} cases, same best title in {agreement['top1']:.1%} of them, "
+          f"score difference mean {agreement['mean_diff']:.4f} / max {agreement['max_diff']:.4f}")
+
+    def legacy(target, candidates):
+        return [matching.legacy_title_similarity(target, title) for title in candidates]
+
+    def current(target, candidates):
+        return matching.TitleMatcher(target).score_many(candidates)
+
+    legacy_time = time_scorer(cases, args.repeat, legacy)
+    current_time = time_scorer(cases, args.repeat, current)
+    print(f"difflib:      {legacy_time:.3f}s")
+    print(f"TitleMatcher: {current_time:.3f}s ({legacy_time / current_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,197 @@
 import time
+import argparse
 import concurrent.futures
 
-from modules.audiovisual import *
-from modules.book import search_book
-from modules.game import *
+from modules.book import submit_book_search
+from modules.politeness import then
+from modules.game import IgdbBatch
+from modules import cache, changes, client, config, databases, game, journal, metrics, notion, pipeline, steps
+from modules.config import MAX_WORKERS, QUEUE_SIZE
+from modules.databases import shared_searches, search_key
 
-def get_all_notion_entries():
+def iter_notion_entries(incremental=False, database=None):
     """
-    Return the titles, types, and release dates of all notion entries
+    Yield the titles, types, and release dates of the notion entries, page by page as Notion returns them
+
+    With incremental, only the pages that are due (see notion.due_filter) are requested from Notion.
     """
-    url = f"https://api.notion.com/v1/databases/{DATABASE_ID}/query"
-    all_entries = []
+    since = notion.load_watermark(database.database_id if database else None) if incremental else None
     start_cursor = None
-
     while True:
-        payload = {"page_size": 100}
-        if start_cursor:
-            payload["start_cursor"] = start_cursor
-
-        response = requests.post(url, headers=notion_headers, json=payload, timeout=10)
-        data = response.json()
-        results = data.get("results", [])
-
-        for page in results:
-            title_prop          = page["properties"].get("Name", {})            .get("title", [])
-            type_prop           = page["properties"].get("Type", {})            .get("select", {})
-            release_date_prop   = page["properties"].get("Release date", {})    .get("date", {})
-            update              = page["properties"].get("Update",{})           .get("select",{})
-            status              = page["properties"].get("Status",{})           .get("select",{})
-            next_air_date       = page["properties"].get("Next air date", {})   .get("date", {})
-            page_id             = page["id"]
-
-            if type_prop and status:
-                if  status.get("name") not in ["Released", "Ended", "Canceled"]:
-                    update = True
-            elif type_prop and not status:
-                update = True
-
-            if update and (type(update) != bool):
-                update = update.get("name")
-                if update == "Yes":
-                    update = True
-                else:
-                    update = False
-            else:
-                update = True
-            if title_prop and update:
-                name = title_prop[0]["text"]["content"]
-                media_type = type_prop.get("name") if type_prop else None
-                release_date = release_date_prop.get("start") if release_date_prop else None
-                all_entries.append({
-                    "title": name,
-                    "type": media_type,
-                    "release_date": release_date,
-                    "page_id": page_id
-                })
-
-        if data.get("has_more"):
-            start_cursor = data["next_cursor"]
-        else:
+        entries, start_cursor = steps.run(notion.entries_page(database, incremental, since, start_cursor))
+        yield from entries
+        if not start_cursor:
             break
 
-    return all_entries
+def get_all_notion_entries(incremental=False):
+    """
+    Return the titles, types, and release dates of all notion entries
+    """
+    return list(iter_notion_entries(incremental))
 
 
-def search(search_query, media_type=None, release_date=None, page_id=None):
+def search(entry):
     """
     Search for media in TMDB, books in multiple sources, or games in RAWG/IGDB and upload to Notion
-    
-    Args:
-        search_query: The query string to search for
-        media_type: The type of media to search for ('Movie', 'Tv Series', 'Book', or 'Game')
-        release_date: Optional release date to help select the right version
-        page_id: Optional ID of an existing Notion page to update
+
+    Entries with the same title searched at the same time (usually in other databases) wait for the first search and
+    reuse its result, later ones get their responses from the cache.
     """
+    started = time.monotonic()
     try:
-        if media_type == "Game":
-            result = search_game(search_query)
-        elif media_type == "Movie" or media_type == "TV Series" :
-            result = search_movies_and_series(search_query, media_type, release_date)
-        elif media_type == "Book":
-            result = search_book(search_query)
-        else:
-            print(f"{media_type} not supported.")
-            result = None
-
-        if result:
-            to_notion(result, media_type, page_id)
-            return None
-        return None
+        with metrics.timed("search"):
+            result = shared_searches.run(search_key(entry), lambda: steps.run(pipeline.find(entry)))
+    except Exception as e:
+        return failed(e, entry, started)
+    return upload(result, entry, started)
 
+def upload(result, entry, started=None):
+    """
+    Upload the result of a search to Notion, and record the time since the search started as the entry's time
+    """
+    started = started or time.monotonic()
+    try:
+        steps.run(pipeline.upload(entry, result))
     except Exception as e:
-        print(f"❌ Error processing '{search_query}': {e}")
-        return None
+        steps.run(pipeline.failed(entry, e))
+    metrics.record_stage("entry", time.monotonic() - started)
+    return None
+
+def failed(error, entry, started=None):
+    """
+    Record an entry whose search raised an error, and the time since its search started as the entry's time
+    """
+    started = started or time.monotonic()
+    steps.run(pipeline.failed(entry, error))
+    metrics.record_stage("entry", time.monotonic() - started)
+    return None
+
+class StartClock:
+    """
+    Executor that remembers when the first task submitted through it started on a worker, the start of the search of a
+    book (its Goodreads requests run as separate tasks)
+    """
+    def __init__(self, executor):
+        self.executor = executor
+        self.started  = None
+
+    def submit(self, fn, *args):
+        def run(*args):
+            if self.started is None:
+                self.started = time.monotonic()
+            return fn(*args)
+        return self.executor.submit(run, *args)
+
+def submit_entry(executor, entry, igdb_batch=None):
+    """
+    Submit the search and upload of an entry to the executor and return its future
+
+    Books go through the Goodreads politeness scheduler one request at a time, instead of taking a worker that
+    would sleep between requests, and a book search that raised is recorded as failed like in search(). Games wait
+    for their IGDB query to be answered in a batch with other games.
+    """
+    if entry["type"] == "Book":
+        clock = StartClock(executor)
+        found = shared_searches.submit(search_key(entry),
+                                       lambda: submit_book_search(clock, entry["title"], entry["page_id"]))
+        return then(found, lambda result: executor.submit(metrics.queued(upload), result, entry, clock.started),
+                    lambda error: executor.submit(metrics.queued(failed), error, entry, clock.started))
+    if entry["type"] == "Game" and igdb_batch:
+        prefetched = igdb_batch.submit(entry["title"], entry["page_id"])
+        return then(prefetched, lambda _: executor.submit(metrics.queued(search), entry))
+    return executor.submit(metrics.queued(search), entry)
+
+def check_results(futures):
+    for future in futures:
+        try:
+            future.result()  # Get the result of the future (or exception if one was raised)
+        except Exception as e:
+            metrics.count("errors")
+            print(f"Error processing entry: {e}")
+
+def finish_run(watermark, feed, notion_databases, report=None, prometheus=None):
+    """
+    Save what the next run starts from, once every entry was processed
+
+    The watermark only moves when no entry failed: a new row whose search failed wasn't edited, so an incremental
+    run starting after it would never ask Notion for it again.
+    """
+    journal.finish()
+    states = journal.counts()
+    if not states.get("failed"):
+        for database in notion_databases:
+            notion.save_watermark(watermark, database.database_id)
+    changes.save_run(feed.until, journal.pages("written"), journal.pages("failed"))
+    for name in journal.STATES:
+        metrics.count(f"journal_{name}", states.get(name, 0))
+    if states.get("failed"):
+        print(f"{states['failed']} entries failed, they're marked \"Update: Yes\" so the next run searches them again")
+    metrics.write_report(report, prometheus)
+
+def main(engine="thread", cache_mode="on", incremental=False, game_policy=None, report=None, prometheus=None,
+         resume=False):
+    cache.mode = cache_mode
+    if game_policy:
+        config.GAME_SOURCE_POLICY = game_policy
+    metrics.reset()
+    game.prefetched.clear()
+    notion_databases = databases.load()
+    watermark = notion.new_watermark()
+    feed = changes.ChangesFeed.since_last_run()
+    if journal.start(resume):
+        print("Resuming the last run, skipping the entries it already wrote.")
+    if engine == "async":
+        import asyncio
+        from modules.async_engine import run
+        asyncio.run(run(incremental, feed, notion_databases))
+        finish_run(watermark, feed, notion_databases, report, prometheus)
+        return
 
-def main():
     start_time = time.time()
-    entries = get_all_notion_entries()
-    print(f"Found {len(entries)} entries in Notion\'s database.")
-    
+
     # Use ThreadPoolExecutor for parallel processing
     with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Create a list of futures (tasks to be executed in parallel)
-        futures = [executor.submit(search, entry["title"], entry["type"], entry["release_date"], entry["page_id"]) 
-                  for entry in entries]
-
-        # Process results as they complete
-        for i, future in enumerate(concurrent.futures.as_completed(futures)):
-            try:
-                future.result()  # Get the result of the future (or exception if one was raised)
-            except Exception as e:
-                print(f"Error processing entry: {e}")
-
+        pending = set()
+        igdb_batch = IgdbBatch(lambda step: executor.submit(steps.run, step))
+
+        # Entries are submitted while Notion is still being paginated, waiting whenever too many are queued. With
+        # several databases, their entries are taken in turns
+        scan = pipeline.Scan(feed)
+        entries = databases.interleave(iter_notion_entries(incremental, database) for database in notion_databases)
+        for entry in entries:
+            if not scan.admit(entry):
+                continue
+            if len(pending) >= MAX_WORKERS + QUEUE_SIZE:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                check_results(done)
+            pending.add(submit_entry(executor, entry, igdb_batch))
+
+        igdb_batch.flush()
+        scan.finish(len(notion_databases))
+        check_results(concurrent.futures.wait(pending).done)
+
+    client.close()
+    finish_run(watermark, feed, notion_databases, report, prometheus)
     elapsed_time = time.time() - start_time
     print(f"All entries processed in {elapsed_time:.2f} seconds.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Update a Notion media database from TMDB, IGDB, RAWG and Goodreads")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread",
+                        help="run entries on the thread pool (default) or on the asyncio pipeline")
+    parser.add_argument("--no-cache", action="store_const", dest="cache_mode", const="off", default="on",
+                        help="don't read or write the local response cache")
+    parser.add_argument("--refresh", action="store_const", dest="cache_mode", const="refresh",
+                        help="fetch everything again and overwrite the local response cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ask Notion for the pages that are due or were edited since the last run")
+    parser.add_argument("--game-policy", choices=["fallback", "first", "rank"],
+                        help="IGDB then RAWG (fallback), both at once with the first answer winning (first), "
+                             "or both at once ranking all their results together (rank)")
+    parser.add_argument("--report", help=f"where to write the JSON report of the run (default {config.METRICS_REPORT})")
+    parser.add_argument("--prometheus", help="also write the metrics of the run to this Prometheus textfile")
+    parser.add_argument("--resume", action="store_true",
+                        help="if the last run didn't finish, skip the entries it already wrote and retry the rest")
+    args = parser.parse_args()
+    main(engine=args.engine, cache_mode=args.cache_mode, incremental=args.incremental, game_policy=args.game_policy,
+         report=args.report, prometheus=args.prometheus, resume=args.resume)
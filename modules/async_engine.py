@@ -0,0 +1,80 @@
+# asyncio version of the pipeline in main.py, selected with `--engine async`
+#
+# The searches and writes are the steps of modules/pipeline.py, run on the event loop by steps.run_async. Only the
+# scheduling of the entries (queue, workers, IGDB batches) is specific to this engine.
+import time
+import asyncio
+
+from modules import client, databases, metrics, notion, pipeline, steps
+from modules.config import ASYNC_MAX_ENTRIES, QUEUE_SIZE
+from modules.game import IgdbBatch
+from modules.databases import shared_searches, search_key
+
+
+async def iter_notion_entries(http, incremental=False, database=None):
+    """
+    Yield the titles, types, and release dates of the notion entries, page by page as Notion returns them
+    """
+    since = notion.load_watermark(database.database_id if database else None) if incremental else None
+    start_cursor = None
+    while True:
+        entries, start_cursor = await steps.run_async(http, notion.entries_page(database, incremental, since,
+                                                                                  start_cursor))
+        for entry in entries:
+            yield entry
+        if not start_cursor:
+            break
+
+
+async def search(http, entry):
+    """
+    Search one Notion entry in its source and upload the result, same as main.search
+    """
+    try:
+        with metrics.timed("search"):
+            result = await shared_searches.run_async(search_key(entry),
+                                                     lambda: steps.run_async(http, pipeline.find(entry)))
+        await steps.run_async(http, pipeline.upload(entry, result))
+    except Exception as e:
+        await steps.run_async(http, pipeline.failed(entry, e))
+
+
+async def run(incremental=False, feed=None, notion_databases=None):
+    start_time = time.time()
+    async with client.AsyncClient() as http:
+        # Entries in flight are bounded by the number of workers, requests per API are bounded by the client
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+        # Games wait for their IGDB query to be answered in a batch with other games before being searched
+        igdb_batch = IgdbBatch(lambda step: asyncio.ensure_future(steps.run_async(http, step)),
+                               asyncio.get_running_loop().create_future)
+
+        async def worker():
+            while (item := await queue.get()) is not None:
+                entry, ready, queued_at = item
+                metrics.record_stage("queue_wait", time.monotonic() - queued_at)
+                if ready:
+                    await ready
+                started = time.monotonic()
+                await search(http, entry)
+                metrics.record_stage("entry", time.monotonic() - started)
+
+        workers = [asyncio.create_task(worker()) for _ in range(ASYNC_MAX_ENTRIES)]
+        scan = pipeline.Scan(feed)
+        entries = databases.interleave_async(iter_notion_entries(http, incremental, database)
+                                             for database in notion_databases or [None])
+        async for entry in entries:
+            # The first movie or series downloads the TMDB changes feed, outside of the event loop
+            if not await asyncio.to_thread(scan.admit, entry):
+                continue
+            ready = igdb_batch.submit(entry["title"], entry["page_id"]) if entry["type"] == "Game" else None
+            await queue.put((entry, ready, time.monotonic()))
+        igdb_batch.flush()
+        scan.finish(len(notion_databases or [None]))
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    elapsed_time = time.time() - start_time
+    print(f"All entries processed in {elapsed_time:.2f} seconds.")
@@ -1,41 +1,85 @@
 from urllib.parse import quote
-from modules.config import *
+from modules.config import (CACHE_TTL_SEARCH, CACHE_TTL_RELEASED, CACHE_TTL_AIRING, CACHE_TTL_DEFAULT,
+                            CACHE_TTL_EMPTY, tmdb_headers, choose_best_result)
+from modules import config, memo
+from modules.steps import Call, All
 
 valid_streaming = ["Netflix", "Disney Plus", "Amazon Prime Video", "Max", "Apple TV+", "HBO Max"]
 languages = ["pt-BR", "en-US"]
 
 
-def search_movies_and_series(search_query, media_type, release_date=None):
-    results = []
-    url = ""
-    for lang in languages:    
-        # Search URL for TMDB
-        url = ("https://api.themoviedb.org/3/search/"
-                    f"{'tv' if media_type == 'TV Series' else 'movie'}"
-                    "?append_to_response=credits,watch/provider"
-                    f"&query={quote(search_query, safe='')}"
-                    f"&language={lang}"
-                    "&include_adult=true"
-                    "&page=1")
-
-        # Search TMDB and check for results
-        response = requests.get(url, headers=tmdb_headers)
-        response = response.json().get("results", [])
-        if not response:
-            continue
-        for result in response:
-            result["language"] = lang
-            results.append(result)
+def tmdb_search_url(search_query, media_type, lang):
+    # Search URL for TMDB
+    return ("https://api.themoviedb.org/3/search/"
+                f"{'tv' if media_type == 'TV Series' else 'movie'}"
+                "?append_to_response=credits,watch/provider"
+                f"&query={quote(search_query, safe='')}"
+                f"&language={lang}"
+                "&include_adult=true"
+                "&page=1")
+
+def tmdb_detail_url(best_choice, media_type):
+    # Get extra info from the result
+    kind = "movie" if media_type == "Movie" else "tv"
+    return (f"https://api.themoviedb.org/3/{kind}/{best_choice.get('id')}"
+            f"?append_to_response=credits,watch/providers&language={best_choice.get('language')}")
+
+def tmdb_search_ttl(response):
+    # Titles TMDB doesn't list yet are searched again by the next run
+    if response.json().get("results"):
+        return CACHE_TTL_SEARCH
+    return CACHE_TTL_EMPTY
+
+def tmdb_detail_ttl(response):
+    # Series still airing change every week, finished titles almost never
+    data = response.json()
+    if data.get("next_episode_to_air") or data.get("status") in ["Returning Series", "In Production", "Planned", "Pilot"]:
+        return CACHE_TTL_AIRING
+    if data.get("status") in ["Released", "Ended", "Canceled"]:
+        return CACHE_TTL_RELEASED
+    return CACHE_TTL_DEFAULT
+
+def search_tmdb(search_query, media_type, lang):
+    # Search TMDB and tag the results with their language
+    response = yield Call("GET", tmdb_search_url(search_query, media_type, lang), headers=tmdb_headers,
+                          cache_ttl=tmdb_search_ttl)
+    results = response.json().get("results", [])
+    for result in results:
+        result["language"] = lang
+    return results
+
+def search_movies_and_series(search_query, media_type, release_date=None, page_id=None):
+    """
+    Step searching a movie or series in TMDB, returns the details of the best match
+    """
+    # Go straight to the details if this page was already matched in a previous run
+    known = memo.lookup(page_id, search_query, media_type)
+    if known and known["source"] == "tmdb":
+        response = yield Call("GET", tmdb_detail_url({"id": known["external_id"], "language": known["language"]},
+                                                     media_type), headers=tmdb_headers, cache_ttl=tmdb_detail_ttl)
+        if response.status_code == 200:
+            return response.json()
+        memo.forget(page_id)
+
+    # Search every language at the same time, keeping the results in the order of `languages`
+    if config.FANOUT_LANGUAGES:
+        found = yield All(*[search_tmdb(search_query, media_type, lang) for lang in languages])
+    else:
+        found = []
+        for lang in languages:
+            found.append((yield from search_tmdb(search_query, media_type, lang)))
+    results = [result for language_results in found for result in language_results or []]
     if not results:
         print(f"No valid result for '{search_query}'.")
         return None
 
     # Choose the best result based on title, popularity or release date and get its ID
     best_choice = choose_best_result(results, search_query, release_date)
-    # Get extra info from the result
-    if media_type == "Movie":
-        url = f"https://api.themoviedb.org/3/movie/{best_choice.get("id")}?append_to_response=credits,watch/providers&language={best_choice.get("language")}"
-    elif media_type == "TV Series":
-        url = f"https://api.themoviedb.org/3/tv/{best_choice.get("id")}?append_to_response=credits,watch/providers&language={best_choice.get("language")}"
-    response = requests.get(url, headers=tmdb_headers, timeout=10)
-    return response.json()
+    response = yield Call("GET", tmdb_detail_url(best_choice, media_type), headers=tmdb_headers,
+                          cache_ttl=tmdb_detail_ttl)
+    data = response.json()
+    if response.status_code == 200:
+        memo.remember(page_id, search_query, media_type,
+                      data.get("title") if media_type == "Movie" else data.get("name"),
+                      "tmdb", best_choice.get("id"), best_choice.get("language"))
+    return data
@@ -1,15 +1,63 @@
-
+from modules import memo, steps
+from modules.config import GOODREADS_MIN_GAP, GOODREADS_JITTER
 from modules.bookscrapper import GoodreadsBookScraper
+from modules.politeness import PolitenessScheduler, then
+
+# One scraper and one politeness scheduler for every worker
+goodreads = PolitenessScheduler(GOODREADS_MIN_GAP, GOODREADS_JITTER)
+scraper   = GoodreadsBookScraper(goodreads)
 
 
-def search_book(search_query, release_date=None):
+def search_book(search_query, release_date=None, page_id=None):
     """
-    Search for a book across multiple APIs and scraping sources
+    Step searching for a book across multiple APIs and scraping sources
     """
     try:
-        scraper = GoodreadsBookScraper()
-        result = scraper.search_and_get_info(search_query)
+        # Open the book page directly if this entry was already matched in a previous run
+        known = memo.lookup(page_id, search_query, "Book")
+        if known and known["source"] == "goodreads":
+            result = yield from scraper.get_book_info(known["external_id"])
+            if "error" not in result:
+                return result
+
+        result = yield from scraper.search_and_get_info(search_query)
+        if "error" not in result:
+            memo.remember(page_id, search_query, "Book", result.get("name"), "goodreads", result.get("url"))
         return result
     except Exception as e:
         print(f"❌ Error processing '{search_query}': {e}")
         return None
+
+
+def submit_book_search(executor, search_query, page_id=None):
+    """
+    Same as search_book, but every request runs as its own task on the executor once its Goodreads slot comes,
+    so workers never sleep between requests. Pages in the response cache don't take a slot.
+
+    Returns:
+        A future with the book information
+    """
+    def fetch(url, step):
+        if scraper.cached(url):
+            return executor.submit(steps.run, step)
+        return goodreads.submit(executor, steps.run, step)
+
+    def search():
+        found = fetch(scraper.build_search_url(search_query), scraper.search_book(search_query, wait=False))
+        return then(then(found, open_book_page), remember)
+
+    def open_book_page(book_url):
+        if not book_url:
+            return {"error": f"Could not find book: {search_query}"}
+        return fetch(book_url, scraper.get_book_info(book_url, wait=False))
+
+    def remember(result):
+        if "error" not in result:
+            memo.remember(page_id, search_query, "Book", result.get("name"), "goodreads", result.get("url"))
+        return result
+
+    known = memo.lookup(page_id, search_query, "Book")
+    if known and known["source"] == "goodreads":
+        known_page = fetch(known["external_id"], scraper.get_book_info(known["external_id"], wait=False))
+        return then(known_page, lambda result: result if "error" not in result else search())
+    return search()
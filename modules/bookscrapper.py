@@ -1,41 +1,148 @@
-import requests
-from bs4 import BeautifulSoup
+from modules import cache
+from modules.config import CACHE_TTL_SEARCH, CACHE_TTL_RELEASED, CACHE_TTL_DEFAULT, CACHE_TTL_EMPTY, GOODREADS_PARSER
+from modules.politeness import PolitenessScheduler
+from modules.steps import Call, Offload, Slot
+from functools import lru_cache
+from importlib.util import find_spec
 import re
-import time
-import random
+
+# bs4 and lxml are only imported once the first book page is parsed
+DEFAULT_PARSER = "lxml" if find_spec("lxml") else "html.parser"
+
+# Attribute values of the page sections parse_book_page reads, everything else is skipped while parsing
+BOOK_SECTIONS = {
+    "class": {"Text__title1", "ContributorLink__name", "TruncatedContent__text",
+              "BookPageMetadataSection__genreButton", "RatingStatistics__rating", "ResponsiveImage"},
+    "data-testid": {"publicationInfo", "pagesFormat"},
+    "role": {"presentation"},
+}
+SEARCH_SECTIONS = {"class": {"bookTitle"}}
+
+_expected_publication = re.compile(r'Expected publication', re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def section_strainer():
+    """
+    The SectionStrainer class, defined on first use since it subclasses bs4's SoupStrainer
+    """
+    from bs4 import SoupStrainer
+
+    class SectionStrainer(SoupStrainer):
+        """
+        Only builds the tags (with everything inside them) that have one of the given attribute values
+
+        Goodreads pages are mostly scripts, reviews and recommendations, so only a small part of the tree gets
+        built.
+        """
+        def __init__(self, sections):
+            super().__init__()
+            self.sections = sections
+
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            for attr, wanted in self.sections.items():
+                value = attrs.get(attr) if attrs else None
+                if value is None:
+                    continue
+                values = value.split() if isinstance(value, str) else value
+                if not wanted.isdisjoint(values):
+                    return True
+            return False
+
+        def allow_string_creation(self, string):
+            return False
+
+    return SectionStrainer
+
+
+def make_soup(html, sections=None, parser=None):
+    """
+    Parse a page with the configured parser, limited to `sections` if given
+    """
+    from bs4 import BeautifulSoup
+    parse_only = section_strainer()(sections) if sections else None
+    return BeautifulSoup(html, parser or GOODREADS_PARSER or DEFAULT_PARSER, parse_only=parse_only)
+
+
+def is_upcoming(html):
+    return bool(_expected_publication.search(html))
+
+
+def book_page_ttl(response):
+    # Upcoming books still get their details filled in, released ones don't change
+    if is_upcoming(response.text):
+        return CACHE_TTL_DEFAULT
+    return CACHE_TTL_RELEASED
+
+def search_page_ttl(response):
+    # Search pages without any book (see parse_search_page) are asked again by the next run
+    if "bookTitle" in response.text:
+        return CACHE_TTL_SEARCH
+    return CACHE_TTL_EMPTY
 
 class GoodreadsBookScraper:
-    def __init__(self):
+    def __init__(self, scheduler=None):
+        # Shared scheduler spacing out the requests of every worker to goodreads.com (1 to 3 seconds apart without one)
+        self.scheduler = scheduler or PolitenessScheduler(1, 2)
         # Using a desktop browser User-Agent to avoid detection
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64;x64)AppleWebKit/'
                           '537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
         }
         
-    def search_book(self, query):
-        """Search for a book on Goodreads and return the URL of the first result."""
-        search_url = f"https://www.goodreads.com/search?q={query.replace(' ', '+')}"
-        response = requests.get(search_url, headers=self.headers)
+    @staticmethod
+    def build_search_url(query):
+        return f"https://www.goodreads.com/search?q={query.replace(' ', '+')}"
+
+    @staticmethod
+    def cached(url):
+        """True if the page is in the response cache, so getting it doesn't send anything to goodreads.com."""
+        return cache.lookup("GET", url) is not None
+
+    def fetch(self, url, cache_ttl, wait=True):
+        """
+        Step getting a Goodreads page, waiting for its politeness slot first unless it's cached (or wait is False,
+        for callers that already waited).
+        """
+        if wait and not self.cached(url):
+            yield Slot(self.scheduler)
+        return (yield Call("GET", url, headers=self.headers, cache_ttl=cache_ttl))
+
+    def search_book(self, query, wait=True):
+        """Step searching for a book on Goodreads, returns the URL of the first result."""
+        response = yield from self.fetch(self.build_search_url(query), search_page_ttl, wait)
         
         if response.status_code != 200:
             return None
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+        return (yield Offload(self.parse_search_page, response.text))
+
+    @staticmethod
+    def parse_search_page(html, parser=None, sections=SEARCH_SECTIONS):
+        """Return the URL of the first book in a Goodreads search page."""
+        soup = make_soup(html, sections, parser)
         book_link = soup.select_one('a.bookTitle')
         
         if book_link:
             return f"https://www.goodreads.com{book_link['href']}"
         return None
 
-    def get_book_info(self, book_url):
+    def get_book_info(self, book_url, wait=True):
 
-        """Scrape book information from a Goodreads book page."""
-        response = requests.get(book_url, headers=self.headers)
+        """Step scraping book information from a Goodreads book page."""
+        response = yield from self.fetch(book_url, book_page_ttl, wait)
         
         if response.status_code != 200:
             return {"error": f"Failed to access page: {response.status_code}"}
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+        return (yield Offload(self.parse_book_page, response.text, book_url))
+
+    @staticmethod
+    def parse_book_page(html, book_url, parser=None, sections=BOOK_SECTIONS):
+        """
+        Extract the book information from the HTML of a Goodreads book page.
+
+        Only the sections in `sections` are parsed (pass None to parse the whole page).
+        """
+        soup = make_soup(html, sections, parser)
         
         book_info = {
             "name":        None,
@@ -96,8 +203,7 @@ class GoodreadsBookScraper:
                 pass
         
         # Check if the book is not yet released
-        not_released_indicator = soup.find(string=re.compile(r'Expected publication', re.IGNORECASE))
-        if not_released_indicator:
+        if is_upcoming(html):
             book_info["is_released"] = False
 
         # Get cover URL
@@ -108,11 +214,9 @@ class GoodreadsBookScraper:
         return book_info
 
     def search_and_get_info(self, book_title):
-        """Search for a book and get its information."""
-        book_url = self.search_book(book_title)
+        """Step searching for a book and getting its information."""
+        # Both requests wait for a politeness slot to avoid being blocked
+        book_url = yield from self.search_book(book_title)
         if not book_url:
             return {"error": f"Could not find book: {book_title}"}
-        
-        # Random delay to avoid being blocked
-        time.sleep(random.uniform(1, 3))
-        return self.get_book_info(book_url)
\ No newline at end of file
+        return (yield from self.get_book_info(book_url))
\ No newline at end of file
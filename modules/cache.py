@@ -0,0 +1,120 @@
+# Persistent SQLite cache for the responses of the search and detail APIs
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from modules import config
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# "on" reads and writes the cache, "refresh" only writes it and "off" skips it entirely
+mode = "on"
+
+
+class ResponseCache:
+    """
+    Key/value store of HTTP responses with a TTL per entry and a size limit
+
+    Entries past their TTL are never returned. When the file grows past max_bytes, expired entries are deleted
+    first and then the least recently used ones, until it's back under 90% of the limit.
+    """
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock      = threading.Lock()
+        self.db        = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               key      TEXT PRIMARY KEY,
+                               status   INTEGER,
+                               content  BLOB,
+                               encoding TEXT,
+                               expires  REAL,
+                               accessed REAL,
+                               size     INTEGER)""")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Return the (status, content, encoding) stored for the key, or None if it's missing or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT status, content, encoding FROM responses WHERE key = ? AND expires > ?",
+                                  (key, now)).fetchone()
+            if row:
+                self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.db.commit()
+        return row
+
+    def set(self, key, status, content, encoding, ttl):
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, status, content, encoding, now + ttl, now, len(content)))
+            self.size += len(content) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now):
+        self.db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        target = self.max_bytes * 0.9
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if self.size <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+
+
+def get_cache():
+    """
+    Return the shared response cache, or None when the cache is turned off
+    """
+    global _cache
+    if mode == "off":
+        return None
+    if not _cache:
+        with _cache_lock:
+            if not _cache:
+                _cache = ResponseCache(config.CACHE_PATH, config.CACHE_MAX_BYTES)
+    return _cache
+
+
+def make_key(method, url, body=None):
+    """
+    Normalized cache key of a request: the method, the URL with sorted query parameters and the body
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ""))
+    if isinstance(body, str):
+        body = body.encode()
+    return hashlib.sha256(method.upper().encode() + b" " + url.encode() + b"\n" + (body or b"")).hexdigest()
+
+
+def lookup(method, url, body=None):
+    cache = get_cache()
+    if not cache or mode == "refresh":
+        return None
+    return cache.get(make_key(method, url, body))
+
+
+def store(method, url, body, response, ttl):
+    """
+    Save a successful response, ttl can be a number of seconds or a function of the response
+    """
+    cache = get_cache()
+    if not cache or response.status_code != 200:
+        return
+    if callable(ttl):
+        ttl = ttl(response)
+    if ttl and ttl > 0:
+        cache.set(make_key(method, url, body), response.status_code, response.content,
+                  getattr(response, "encoding", None) or "utf-8", ttl)
@@ -0,0 +1,124 @@
+# Asks TMDB which movies and series changed since the last run, so the tracked ones that didn't can be skipped
+import threading
+from datetime import date, datetime, timezone
+
+from modules import client, config, fanout, memo, state
+
+state.create_table("""feeds (
+                          name  TEXT PRIMARY KEY,
+                          since TEXT)""")
+# Pages that failed in a run, never skipped as unchanged until they're written: the change that made them due may be
+# before the start of the next window
+state.create_table("""recheck (
+                          page_id TEXT PRIMARY KEY)""")
+
+KINDS = {"Movie": "movie", "TV Series": "tv"}
+
+
+def changes_url(kind, start_date, end_date, page=1):
+    return (f"https://api.themoviedb.org/3/{kind}/changes"
+            f"?start_date={start_date}&end_date={end_date}&page={page}")
+
+def load_since():
+    row = state.fetchone("SELECT since FROM feeds WHERE name = 'tmdb'")
+    return row[0] if row else None
+
+def save_since(day):
+    state.execute("INSERT OR REPLACE INTO feeds VALUES ('tmdb', ?)", (day,))
+
+def load_recheck():
+    return {page_id for page_id, in state.fetchall("SELECT page_id FROM recheck")}
+
+def save_run(until, written, failed):
+    """
+    Start the next window at the end of this one, and keep rechecking the pages that failed until they're written
+    """
+    state.executemany("DELETE FROM recheck WHERE page_id = ?", [(page_id,) for page_id in written])
+    state.executemany("INSERT OR IGNORE INTO recheck VALUES (?)", [(page_id,) for page_id in failed])
+    save_since(until)
+
+def today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+def fetch_changed_ids(kind, start_date, end_date):
+    """
+    IDs of every movie or series ("movie" or "tv") changed between two dates, None if the feed can't be read
+    """
+    def get_page(page):
+        response = client.get(changes_url(kind, start_date, end_date, page), headers=config.tmdb_headers)
+        if response.status_code != 200:
+            raise ValueError(f"{response.status_code} {response.text}")
+        return response.json()
+
+    try:
+        first = get_page(1)
+    except Exception as e:
+        print(f"Error reading the TMDB {kind} changes, refreshing every {kind}: {e}")
+        return None
+    pages = [first] + fanout.run_all(*[lambda page=page: get_page(page)
+                                       for page in range(2, first.get("total_pages", 1) + 1)])
+    if None in pages:
+        print(f"Error reading the TMDB {kind} changes, refreshing every {kind}")
+        return None
+    return {item["id"] for page in pages for item in page.get("results", [])}
+
+def update_requested(entry):
+    update = entry["current"]["properties"].get("Update", {}).get("select") or {}
+    return update.get("name") == "Yes"
+
+
+class ChangesFeed:
+    """
+    The TMDB changes between the last complete run and today, to skip the movies and series that didn't change
+
+    Each feed (movies, series) is only downloaded the first time an entry of its kind needs it. When there was no
+    previous run, or it was longer ago than TMDB_CHANGES_MAX_DAYS (the longest window TMDB accepts), nothing
+    is skipped.
+    """
+    def __init__(self, since=None, until=None, recheck=None):
+        self.since   = since
+        self.until   = until or today()
+        self.recheck = recheck or set()
+        self.ids     = {}
+        self.lock    = threading.Lock()
+
+    @classmethod
+    def since_last_run(cls):
+        if not config.TMDB_CHANGES_FEED:
+            return cls()
+        return cls(load_since(), recheck=load_recheck())
+
+    def usable(self):
+        return (self.since is not None and
+                (date.fromisoformat(self.until) - date.fromisoformat(self.since)).days <= config.TMDB_CHANGES_MAX_DAYS)
+
+    def changed_ids(self, kind):
+        with self.lock:
+            if kind not in self.ids:
+                self.ids[kind] = fetch_changed_ids(kind, self.since, self.until)
+            return self.ids[kind]
+
+    def date_reached(self, entry):
+        # An air or release date passing doesn't always show up as a change in TMDB
+        properties = entry["current"]["properties"]
+        for name in ["Release date", "Next air date"]:
+            start = ((properties.get(name) or {}).get("date") or {}).get("start")
+            if start and self.since <= start[:10] <= self.until:
+                return True
+        return False
+
+    def unchanged(self, entry):
+        """
+        True if the entry is a movie or series already matched to a TMDB ID that didn't change since the last run,
+        and that wasn't marked "Update: Yes", has no release or air date that was reached in the meantime and didn't
+        fail in an earlier run
+        """
+        kind = KINDS.get(entry["type"])
+        if (not kind or not self.usable() or update_requested(entry) or self.date_reached(entry) or
+                entry["page_id"] in self.recheck):
+            return False
+        known = memo.lookup(entry["page_id"], entry["title"], entry["type"])
+        if not known or known["source"] != "tmdb":
+            return False
+        ids = self.changed_ids(kind)
+        return ids is not None and int(known["external_id"]) not in ids
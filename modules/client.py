@@ -0,0 +1,392 @@
+# Shared HTTP layer for every outgoing API call
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import Future
+
+import urllib3
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules import cache, config, metrics, ratelimit
+
+DEFAULT_TIMEOUT = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url):
+    """
+    Return the pooled, keep-alive session for the host of the given URL
+
+    Sessions are created lazily, once per host, and shared by every worker thread. Each one keeps up to
+    MAX_WORKERS open connections to its host (or the lower per-host limit set in HOST_CONNECTION_LIMITS),
+    and blocks instead of opening extra connections past that limit.
+    """
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if not session:
+            pool_size = min(config.MAX_WORKERS, config.HOST_CONNECTION_LIMITS.get(host, config.MAX_WORKERS))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+    return session
+
+
+def upstream_url(url):
+    """
+    URL a request is really sent to: the URL itself, or <API_BASE_URL>/<host>/<path> when API_BASE_URL is set
+    (used to point every API at the local mock server of the benchmarks)
+    """
+    if not config.API_BASE_URL:
+        return url
+    parts = urlsplit(url)
+    return f"{config.API_BASE_URL.rstrip('/')}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+def request_body(kwargs):
+    """
+    Body of a request as sent by requests/aiohttp, used to build cache keys
+    """
+    if kwargs.get("json") is not None:
+        return json.dumps(kwargs["json"], sort_keys=True)
+    return kwargs.get("data")
+
+
+def only_reads(method, url):
+    """
+    True for the requests that don't change anything on the server: GETs, and the POSTs that only read (IGDB
+    queries and Notion database queries)
+    """
+    method = method.upper()
+    return method == "GET" or (method == "POST" and (ratelimit.api_for_url(url) in config.COALESCE_POST_APIS or
+                                                     urlsplit(url).path.endswith("/query")))
+
+
+def not_sent(error):
+    """
+    True if a requests error happened while connecting, before anything reached the server
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)  # NewConnectionError is one too
+
+
+def not_sent_async(error):
+    """
+    Same as not_sent for aiohttp errors
+    """
+    import aiohttp
+
+    return isinstance(error, (aiohttp.ClientConnectorError, getattr(aiohttp, "ConnectionTimeoutError", ())))
+
+
+def coalesce_key(method, url, kwargs):
+    """
+    Key of a request for single-flight: identical requests (method, URL, body and headers) in flight at the same time
+    share one call. None for the requests that can't be shared, the ones that write something.
+    """
+    if not config.COALESCE_REQUESTS or not only_reads(method, url):
+        return None
+    method = method.upper()
+    return (method, url, request_body(kwargs), str(kwargs.get("params")),
+            json.dumps(kwargs.get("headers") or {}, sort_keys=True))
+
+
+class SingleFlight:
+    """
+    Calls in flight by key, a call made while an identical one is running waits for it and gets the same result
+
+    A key is dropped as soon as its call is done, a later call with it runs again (and usually hits the response
+    cache). run() is for threads (the others block until the first one is done), submit() for calls that already
+    return a Future (book searches) and run_async() for the event loop. `counter` is the metric counting the calls
+    that waited for another one.
+    """
+    def __init__(self, counter=None):
+        self.calls   = {}
+        self.lock    = threading.Lock()
+        self.counter = counter
+
+    def joined(self):
+        if self.counter:
+            metrics.count(self.counter)
+
+    def done(self, key, future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def run(self, key, call):
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = Future()
+        if not owner:
+            self.joined()
+            return future.result()
+
+        try:
+            future.set_result(call())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self.done(key, future)
+        return future.result()
+
+    def submit(self, key, submit):
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = submit()
+        if not owner:
+            self.joined()
+            return future
+        # Outside of the lock, the callback runs right away if the future is already done
+        future.add_done_callback(lambda _: self.done(key, future))
+        return future
+
+    async def run_async(self, key, call):
+        import asyncio
+
+        future = self.calls.get(key)
+        if future is None:
+            future = self.calls[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda _: self.done(key, future))
+        else:
+            self.joined()
+        # Shielded, so a caller being cancelled doesn't cancel the call of the others
+        return await asyncio.shield(future)
+
+
+_in_flight = SingleFlight("coalesced_requests")
+
+
+def cached_response(method, url, body):
+    """
+    Rebuild a requests.Response from the response cache, or None on a miss
+    """
+    hit = cache.lookup(method, url, body)
+    if not hit:
+        return None
+    status, content, encoding = hit
+    return build_response(url, status, content, encoding)
+
+
+def build_response(url, status, content, encoding="utf-8"):
+    """
+    requests.Response with the given status and body, for responses that didn't come from the network
+    """
+    response = requests.models.Response()
+    response.status_code = status
+    response._content    = content
+    response.encoding    = encoding
+    response.url         = url
+    return response
+
+
+def request(method, url, cache_ttl=None, **kwargs):
+    """
+    Send a request through the shared session of the URL's host, same signature as requests.request
+
+    The call waits for a token of its API's rate limiter, and 429, 5xx and connection errors are retried up to
+    MAX_RETRIES times before the last response (or error) is handed back to the caller. Requests that write
+    (page creations, PATCHes) are only retried on 429 and when connecting failed: after a timeout or a 5xx the write
+    may have been applied, and sending it again could create a page or append its images twice.
+
+    With cache_ttl (seconds, or a function of the response returning seconds), the response is read from and
+    saved to the on-disk response cache. Requests that only read are sent once while in flight (see coalesce_key).
+    """
+    if cache_ttl is not None:
+        body = request_body(kwargs)
+        response = cached_response(method, url, body)
+        if response is None:
+            response = request(method, url, **kwargs)
+            cache.store(method, url, body, response, cache_ttl)
+        else:
+            metrics.record_cache_hit(method, url)
+        return response
+
+    key = coalesce_key(method, url, kwargs)
+    if key:
+        return _in_flight.run(key, lambda: send(method, url, **kwargs))
+    return send(method, url, **kwargs)
+
+
+def send(method, url, **kwargs):
+    """
+    Send a request with the rate limiting and retries of request(), without the cache and single-flight
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    bucket = ratelimit.get_bucket(url, kwargs.get("headers"))
+    start = time.monotonic()
+    rate_wait = 0.0
+    reads = only_reads(method, url)
+
+    for attempt in range(config.MAX_RETRIES + 1):
+        if bucket:
+            rate_wait += bucket.wait()
+        try:
+            response = get_session(url).request(method, upstream_url(url), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == config.MAX_RETRIES or not (reads or not_sent(e)):
+                metrics.record_call(method, url, None, time.monotonic() - start, attempt, rate_wait)
+                raise
+            time.sleep(ratelimit.retry_delay(attempt))
+            continue
+
+        if (response.status_code not in config.RETRY_STATUSES or attempt == config.MAX_RETRIES or
+                not (reads or response.status_code == 429)):
+            metrics.record_call(method, url, response.status_code, time.monotonic() - start, attempt, rate_wait)
+            return response
+        delay = ratelimit.retry_delay(attempt, response.headers)
+        if response.status_code == 429 and bucket:
+            bucket.pause(delay)
+        time.sleep(delay)
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+
+def close():
+    """
+    Close every pooled session, used at the end of a run
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+class AsyncResponse:
+    """
+    Response returned by AsyncClient, with the same attributes as requests.Response that the project uses
+    """
+    def __init__(self, status_code, content, headers, url):
+        self.status_code = status_code
+        self.content     = content
+        self.headers     = headers
+        self.url         = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncClient:
+    """
+    aiohttp based client used by the asyncio engine
+
+    Every host gets its own semaphore (ASYNC_HOST_LIMITS, or ASYNC_DEFAULT_LIMIT for unlisted hosts), so many
+    requests can be in flight at once without going over what each API accepts.
+    """
+    def __init__(self):
+        self._session    = None
+        self._semaphores = {}
+        self._in_flight  = SingleFlight("coalesced_requests")
+
+    async def __aenter__(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=max(config.ASYNC_HOST_LIMITS.values(),
+                                                                      default=config.ASYNC_DEFAULT_LIMIT))
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    def _semaphore(self, host):
+        import asyncio
+
+        if host not in self._semaphores:
+            limit = config.ASYNC_HOST_LIMITS.get(host, config.ASYNC_DEFAULT_LIMIT)
+            self._semaphores[host] = asyncio.Semaphore(limit)
+        return self._semaphores[host]
+
+    async def request(self, method, url, cache_ttl=None, **kwargs):
+        """
+        Same rate limiting, retries, caching and single-flight as the module level request(), without blocking the
+        event loop
+        """
+        if cache_ttl is not None:
+            body = request_body(kwargs)
+            hit = cache.lookup(method, url, body)
+            if hit:
+                metrics.record_cache_hit(method, url)
+                return AsyncResponse(hit[0], hit[1], {}, url)
+            response = await self.request(method, url, **kwargs)
+            cache.store(method, url, body, response, cache_ttl)
+            return response
+
+        key = coalesce_key(method, url, kwargs)
+        if not key:
+            return await self._send(method, url, **kwargs)
+        return await self._in_flight.run_async(key, lambda: self._send(method, url, **kwargs))
+
+    async def _send(self, method, url, **kwargs):
+        import asyncio
+        import aiohttp
+
+        bucket = ratelimit.get_bucket(url, kwargs.get("headers"))
+        start = time.monotonic()
+        rate_wait = 0.0
+        reads = only_reads(method, url)
+        for attempt in range(config.MAX_RETRIES + 1):
+            if bucket:
+                rate_wait += await bucket.wait_async()
+            try:
+                async with self._semaphore(urlsplit(url).netloc):
+                    async with self._session.request(method, upstream_url(url), **kwargs) as response:
+                        content = await response.read()
+                        result = AsyncResponse(response.status, content, response.headers, str(response.url))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == config.MAX_RETRIES or not (reads or not_sent_async(e)):
+                    metrics.record_call(method, url, None, time.monotonic() - start, attempt, rate_wait)
+                    raise
+                await asyncio.sleep(ratelimit.retry_delay(attempt))
+                continue
+
+            if (result.status_code not in config.RETRY_STATUSES or attempt == config.MAX_RETRIES or
+                    not (reads or result.status_code == 429)):
+                metrics.record_call(method, url, result.status_code, time.monotonic() - start, attempt, rate_wait)
+                return result
+            delay = ratelimit.retry_delay(attempt, result.headers)
+            if result.status_code == 429 and bucket:
+                bucket.pause(delay)
+            await asyncio.sleep(delay)
+        return result
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
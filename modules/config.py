@@ -1,15 +1,12 @@
 # API Keys and other secret codes
-import json
+import math
 import os
-import numpy as np
-import re
 
-from difflib import SequenceMatcher
-from datetime import datetime
-
-import requests
 from dotenv import load_dotenv
 
+# Nothing else of the project is imported here, every module reads its settings from this one. ranking (NumPy),
+# matching (difflib) and metrics are imported where they're used, only runs that rank results load them
+
 load_dotenv()
 WATCH_REGION         = "BR"
 MAX_WORKERS          = 10
@@ -22,6 +19,108 @@ IGDB_CLIENT_ID       = os.getenv("IGDB_CLIENT_ID")
 IGDB_CLIENT_SECRET   = os.getenv("IGDB_CLIENT_SECRET")
 GOOGLE_BOOKS_API_KEY = os.getenv("GOOGLE_BOOKS_API_KEY")
 
+# JSON list of the Notion databases to update in one run, see modules/databases.py (DATABASE_ID and NOTION_TOKEN
+# are used when the file doesn't exist)
+DATABASES_FILE = os.getenv("DATABASES_FILE", "databases.json")
+
+# Send every API call to <API_BASE_URL>/<host>/<path> instead, e.g. the mock server of benchmarks/pipeline.py
+API_BASE_URL = os.getenv("API_BASE_URL")
+
+# Per-host cap on pooled connections, anything not listed can use up to MAX_WORKERS
+HOST_CONNECTION_LIMITS = {
+    "api.notion.com":    3,
+    "api.igdb.com":      4,
+    "www.goodreads.com": 2,
+}
+
+# Search every TMDB language at the same time, and how to combine IGDB and RAWG ("fallback", "first" or "rank")
+FANOUT_LANGUAGES   = True
+GAME_SOURCE_POLICY = os.getenv("GAME_SOURCE_POLICY", "fallback")
+FANOUT_WORKERS     = 2 * MAX_WORKERS
+
+# IGDB queries of the game entries sent together in one /v4/multiquery request (IGDB accepts up to 10)
+IGDB_BATCH_SIZE = 10
+
+# Skip the movies and series TMDB lists as unchanged since the last run (TMDB only lists the last 14 days)
+TMDB_CHANGES_FEED     = True
+TMDB_CHANGES_MAX_DAYS = 14
+
+# Entries with a non-final status are only refreshed when a release or air date is reached, or every RECHECK_INTERVAL
+AIR_DATE_SCHEDULE = True
+RECHECK_INTERVAL  = float(os.getenv("RECHECK_DAYS", 7)) * 24 * 3600
+
+# Saved OAuth tokens (Twitch for IGDB) are renewed when they have less than this many seconds left
+TOKEN_REFRESH_MARGIN = 3600
+
+# Entries waiting for a free worker while the Notion database is still being read
+QUEUE_SIZE = 100
+
+# Entries backfill.py resolves before creating their pages (the next batch is resolved while they're created)
+BACKFILL_BATCH_SIZE = 100
+
+# Limits for the asyncio engine: entries in flight and concurrent requests per host
+ASYNC_MAX_ENTRIES   = 200
+ASYNC_DEFAULT_LIMIT = 20
+ASYNC_HOST_LIMITS   = {
+    "api.notion.com":     3,
+    "api.themoviedb.org": 40,
+    "api.igdb.com":       4,
+    "id.twitch.tv":       1,
+    "api.rawg.io":        10,
+    "www.goodreads.com":  2,
+}
+
+# Requests per second allowed for each API, they can be changed with RATE_LIMIT_<API> environment variables
+API_HOSTS = {
+    "api.notion.com":     "notion",
+    "api.themoviedb.org": "tmdb",
+    "api.igdb.com":       "igdb",
+    "id.twitch.tv":       "twitch",
+    "api.rawg.io":        "rawg",
+    "www.goodreads.com":  "goodreads",
+}
+RATE_LIMITS = {
+    api: float(os.getenv(f"RATE_LIMIT_{api.upper()}", default))
+    for api, default in {"notion": 3, "tmdb": 40, "igdb": 4, "twitch": 1, "rawg": 5}.items()
+}
+# APIs whose limit applies to each token (Notion integration) instead of the whole API, they get a bucket per token
+PER_TOKEN_LIMITS = {"notion"}
+
+# Identical requests in flight at the same time share one call (GETs, and the POSTs that only read: IGDB queries and
+# Notion database queries)
+COALESCE_REQUESTS  = True
+COALESCE_POST_APIS = {"igdb"}
+
+# Seconds between two requests to goodreads.com, across every worker (plus a random jitter up to GOODREADS_JITTER)
+GOODREADS_MIN_GAP = float(os.getenv("GOODREADS_MIN_GAP", 0.5))
+GOODREADS_JITTER  = 0.5
+# BeautifulSoup parser for Goodreads pages, "lxml" (the default when installed) or Python's "html.parser"
+GOODREADS_PARSER  = os.getenv("GOODREADS_PARSER")
+
+# Retries for 429, 5xx and connection errors, waiting Retry-After or a jittered exponential backoff. Requests that
+# write (anything but the reads of COALESCE_REQUESTS) are only retried on 429 and when they couldn't connect
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES    = 4
+BACKOFF_BASE   = 0.5
+BACKOFF_MAX    = 30
+
+# Local state kept between runs (response cache, resolved IDs and others)
+STATE_DIR       = os.getenv("STATE_DIR", ".state")
+STATE_PATH      = os.path.join(STATE_DIR, "state.sqlite")
+CACHE_PATH      = os.path.join(STATE_DIR, "cache.sqlite")
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# JSON report of each run (API calls, latencies, stage timings), and an optional Prometheus textfile
+METRICS_REPORT      = os.getenv("METRICS_REPORT", os.path.join(STATE_DIR, "report.json"))
+PROMETHEUS_TEXTFILE = os.getenv("PROMETHEUS_TEXTFILE")
+
+# How long cached responses are kept, in seconds
+CACHE_TTL_SEARCH   = 30 * 24 * 3600  # Search results
+CACHE_TTL_RELEASED = 30 * 24 * 3600  # Released movies, ended series, released games and books
+CACHE_TTL_AIRING   = 12 * 3600       # Series still airing or with an episode announced
+CACHE_TTL_DEFAULT  = 24 * 3600       # Everything else (upcoming titles, unknown status)
+CACHE_TTL_EMPTY    = 12 * 3600       # Searches that found nothing, asked again by the next daily run
+
 valid_streaming = ["Netflix", "Disney Plus", "Amazon Prime Video", "Max", "Apple TV+", "HBO Max"]
 
 # Configure headers for the APIs
@@ -38,7 +137,6 @@ igdb_headers = {
     "Client-ID": IGDB_CLIENT_ID,
     "Authorization": None
 }
-igdb_token = None
 
 
 def choose_best_result(results, target_title, target_release_date=None):
@@ -60,48 +158,10 @@ def choose_best_result(results, target_title, target_release_date=None):
     if len(results) == 1:
         return results[0]
 
-    # If we have a target release date, find the result closest to that date
-    best_match = [0, None]
-
-    pop_ratio = 1
-    for result in results:
-        if result.get("total_rating_count"): pop_ratio = result.get("total_rating_count")\
-                                                if result.get("total_rating_count") > pop_ratio else pop_ratio
-    # Calculate scores for each result
-    for item in results:
-
-        item_title = item.get("title", item.get("name", ""))
-        title_score = calculate_title_similarity(target_title, item_title)
-
-        date_score = 0
-        if target_release_date:
-            release_date = (item.get("release_date") or
-                            item.get("first_air_date") or
-                            item.get("first_release_date") or
-                            item.get("released"))
-
-            if release_date:
-                days_diff = calculate_date_similarity(release_date, target_release_date)
-                max_diff = 1095
-                date_score = max(0, 1 - min(days_diff, max_diff) / max_diff)
-
-        # Get the popularity score (already normalized by TMDB)
-        popularity = item.get("popularity", 0) / 100.0 if item.get("pop")\
-                else item.get("total_rating_count") if item.get("total_rating_count")\
-                else 0
-
-        popularity_score = min(1.0, float(popularity)/pop_ratio)  # Cap at 1.0
-
-        final_score = (0.5 * title_score) + (0.3 * date_score) + (0.2 * popularity_score)
-        # Check if this is the best match so far
-        if final_score > best_match[0]:
-            best_match = [final_score, item]
-
-    if best_match:
-        return best_match[1]
-
-    # Otherwise, return the first result
-    return results[0]
+    # Score title, release date and popularity of every result at once
+    from modules import metrics, ranking
+    with metrics.timed("rank"):
+        return ranking.best_result(results, target_title, target_release_date)
 
 def calculate_date_similarity(date1_str, date2_str):
     """
@@ -111,15 +171,11 @@ def calculate_date_similarity(date1_str, date2_str):
     if not date1_str or not date2_str:
         return float('inf')  # Return infinity if either date is missing
 
-    try:
-        if isinstance(date1_str, int) or (isinstance(date1_str, str) and date1_str.isdigit()):
-            date1 = datetime.fromtimestamp(int(date1_str))
-        else: date1 = datetime.strptime(str(date1_str)[:10], "%Y-%m-%d")
-
-        date2 = datetime.strptime(date2_str[:10], "%Y-%m-%d")
-        return abs((date1 - date2).days)
-    except ValueError:
+    from modules import ranking
+    days = ranking.parse_day(date1_str) - ranking.parse_day(str(date2_str)[:10])
+    if math.isnan(days):
         return float('inf')  # Return infinity if date parsing fails
+    return abs(math.floor(days))
 
 def calculate_title_similarity(title1, title2):
     """
@@ -132,224 +188,5 @@ def calculate_title_similarity(title1, title2):
     Returns:
         A similarity score between 0 and 1, where 1 is a perfect match
     """
-    # Normalize titles for better comparison
-    def normalize(title):
-        # Convert to lowercase and remove special characters
-        norm = re.sub(r'[^\w\s]', '', title.lower())
-        # Remove extra spaces
-        norm = re.sub(r'\s+', ' ', norm).strip()
-        return norm
-
-    title1_norm = normalize(title1)
-    title2_norm = normalize(title2)
-
-    # Check for an exact match first
-    if title1_norm == title2_norm:
-        return 1.0
-
-    # Use a sequence matcher for fuzzy matching
-    ratio = SequenceMatcher(None, title1_norm, title2_norm).ratio()
-
-    # Give bonus for containment
-    if title1_norm in title2_norm or title2_norm in title1_norm:
-        ratio = (ratio + 0.3) / 1.3  # Weighted average favoring ratio
-
-    return ratio
-
-def to_notion(data, media_type, page_id):
-    """
-    Convert data to Notion properties without making API calls.
-
-    Args:
-        data: The data from what you want to upload to Notion
-        media_type: The type of the data, e.g., "Book" or "Movie"
-        page_id: ID of an existing Notion page to update
-    """
-    properties = {"Type": {"select": {"name": media_type}}}
-    title = ""
-    poster = None
-    cover = None
-    emoji = ""
-
-    if media_type == "Game":
-        emoji        = "🕹️"
-        title        = data.get("title", "")
-        developers   = data.get("developers", [])
-        release_date = data.get("release_date", "")
-        cover        = data.get("background", "")
-        poster       = data.get("cover", "")
-        genres       = data.get("genres", [])
-        rating       = data.get("rating", 0)
-        description  = data.get("description", "")
-        year         = release_date[:4] if release_date else ""
-        platforms    = data.get("platforms", "")
-        publishers   = data.get("publishers", [])
-        status       = data.get("status", "")
-
-        # Add game properties
-        properties["Name"]                = {"title": [{"text": {"content": title}}]}
-        properties["Year"]                = {"rich_text": [{"text": {"content": year}}]}
-        properties["Status"]              = {"select": None} if not status else {"select": {"name": status}}
-        properties["Image"]               = {"files": []} if not poster else {"files":[{"type": "external", "name": "Cover","external": {"url": poster}}]}
-        properties["Director/Publisher"]  = {"multi_select": publishers or []}
-        properties["Writer/Developer"]    = {"multi_select": developers}
-        properties["Genre"]               = {"multi_select": genres}
-        properties["Synopsis"]            = {"rich_text": []} if not description else {"rich_text": [{"text": {"content": description[:2000]}}]}
-        properties["Release date"]        = {"date": None} if not release_date else {"date": {"start": release_date}}
-        properties["Global Rating"]       = {"number": np.round(float(rating),1)}
-        properties["Update"]              = {"select": {"name": "No"}}
-        properties["Streaming/Platforms"] = {"multi_select": platforms or []}
-
-    if media_type == "TV Series" or media_type == "Movie":
-        emoji = "🎞️" if media_type == "Movie" else "🎬"
-        title = data.get("title") if media_type == "Movie" else data.get("name", "")
-
-        if data.get("poster_path"):
-            cover = f"https://image.tmdb.org/t/p/original{data.get('poster_path')}"
-            poster = f"https://image.tmdb.org/t/p/original{data.get('poster_path')}"
-        if data.get("backdrop_path"):
-            cover = f"https://image.tmdb.org/t/p/original{data.get('backdrop_path')}"
-
-        genres        = data.get("genres", [])
-        status        = data.get("status")
-        synopsis      = data.get("overview")
-        release_date  = data.get("release_date") if media_type == "Movie" else data.get("first_air_date")
-        global_rating = data.get("vote_average", 0)
-        year          = release_date[:4] if release_date else ""
-        credit        = data.get("credits", {})
-        crew          = credit.get("crew", [])
-
-        writers   = []
-        directors = []
-
-        for member in crew:
-            if member.get("job") == "Screenplay" or member.get("job") == "Writer":
-                writers.append({"name": member["name"]})
-            if member.get("job") == "Director":
-                directors.append({"name": member["name"]})
-
-        # Get streaming providers
-        providers_data = data.get("watch/providers", {})
-        streaming = []
-        try:
-            country_data = providers_data["results"].get(WATCH_REGION, {})
-            flatrate = country_data.get("flatrate", [])
-            for provider in flatrate:
-                if provider["provider_name"] in valid_streaming: streaming.append({"name": provider["provider_name"]})
-        except Exception as e:
-            streaming = [{"name": "Not available"}]
-            print(f"Error getting streaming providers: {e}")
-        for d in genres: d.pop('id', None)  # `None` prevents error if the key doesn't exist
-
-        # Add shared properties
-        properties["Update"]              = {"select": {"name": "No"}}
-        properties["Name"]                = {"title": [{"text": {"content": title or ""}}]}
-        properties["Year"]                = {"rich_text": [{"text": {"content": year or ""}}]}
-        properties["Image"]               = {"files": []} if not poster else { "files": [{"type": "external", "name": "Cover", "external": {"url": poster}}]}
-        properties["Status"]              = {"select": None} if not status else {"select": {"name": status}}
-        properties["Genre"]               = {"multi_select": genres or []}
-        properties["Writer/Developer"]    = {"multi_select": writers or []}
-        properties["Director/Publisher"]  = {"multi_select": directors or []}
-        properties["Synopsis"]            = {"rich_text": []} if not synopsis else {"rich_text": [{"text": {"content": synopsis}}]}
-        properties["Streaming/Platforms"] = {"multi_select": streaming or []}
-        properties["Release date"]        = {"date": None} if not release_date else {"date": {"start": release_date}}
-        properties["Global Rating"]       = {"number": np.round(global_rating,1) or 0}
-
-        # TV Series specific fields
-        if media_type == "TV Series":
-            emoji        = "🎬"
-            episodes     = data.get("number_of_episodes", 0)
-            seasons      = data.get("number_of_seasons", 0)
-            next_episode = data.get("next_episode_to_air", {})
-            last_episode = data.get("last_episode_to_air", {})
-            properties["Seasons"]        = {"number": seasons or 0}
-            properties["Episodes/pages"] = {"number": episodes or 0}
-
-            if last_episode:
-                season           = last_episode.get("season_number", 0)
-                episode          = last_episode.get("episode_number", 0)
-                ep_name          = last_episode.get("name", "")
-                last_episode_str = f"S{season:02}, E{episode:02}: {ep_name}"
-                properties["Last episode"] = {"rich_text": [{"text": {"content": last_episode_str}}]}
-
-            if next_episode:
-                properties["Upcoming episode"] = {"rich_text": [{"text": {"content": next_episode.get("name", "")}}]}
-                properties["Next air date"]    = {"date": {"start": next_episode.get("air_date", "")}}
-
-    if media_type == "Book":
-        emoji        = "📚"
-        title        = data.get("name", "")
-        author       = data.get("writer", [])
-        release_date = data.get("first_publication_year", "")
-        cover        = data.get("cover", "")
-        genres       = data.get("genres", [])
-        rating       = data.get("rating", 0)
-        description  = data.get("summary", "")
-        year         = release_date[-4:] if release_date else ""
-        status       = data.get("is_released", "")
-        pages        = data.get("pages", {})
-
-        genres = [{"name": string} for string in genres]
-        status = "Released" if status else "Upcoming"
-        release_date = datetime.strptime(release_date, "%B %d, %Y")
-        release_date = release_date.strftime("%Y-%m-%d")
-
-        # Add book properties
-        properties["Name"]             = {"title": [{"text": {"content": title}}]}
-        properties["Year"]             = {"rich_text": [{"text": {"content": year}}]}
-        properties["Status"]           = {"select": None} if not status else {"select": {"name": status}}
-        properties["Image"]            = {"files": []} if not cover else {"files":[{"type": "external", "name": "Cover","external": {"url": cover}}]}
-        properties["Writer/Developer"] = {"multi_select": [{"name": author}] or []}
-        properties["Genre"]            = {"multi_select": genres or []}
-        properties["Synopsis"]         = {"rich_text": []} if not description else {"rich_text": [{"text": {"content": description[:2000]}}]}
-        properties["Release date"]     = {"date": {"start": release_date}} if release_date else {"date": None}
-        properties["Global Rating"]    = {"number": np.round(float(rating*2),1)}
-        properties["Update"]           = {"select": {"name": "No"}}
-        properties["Episodes/pages"]   = {"number": pages or 0}
-
-    cover = cover if cover else poster if poster else None
-    payload = {"properties": properties,
-               "cover": {"type": "external", "external": {"url": cover}} if cover else None}
-    #--------------------------------------------
-
-
-    img_body = {"children": []}
-    img_body["children"].append({
-        "object": "block",
-        "type": "image",
-        "image": payload["cover"]})
-
-    if cover != poster:
-        img_body["children"].append({
-            "object": "block",
-            "type": "image",
-            "image":{"type": "external", "external": {"url": poster}}})
-
-    # Add images to the page if they don't exist already
-    url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
-    response = requests.get(url, headers=notion_headers)
-
-    if response.status_code != 200:
-        print(f"Error retrieving children: {response.text}")
-        return []
-
-    blocks = response.json().get("results", [])
-    img_body_copy = img_body.copy()
-    for block in blocks:
-        for child in img_body_copy["children"]:
-            if block.get("type") == "image":
-                if (block.get("image", {}).get("external", {}).get("url") ==
-                        child["image"]["external"]["url"]):
-                    img_body["children"].remove(child)
-
-    # If we have a page ID, update that page
-    update_url = f"https://api.notion.com/v1/blocks/{page_id}/children"
-    requests.patch(update_url,headers=notion_headers,json=img_body)
-    update_url = f"https://api.notion.com/v1/pages/{page_id}"
-    update_response = requests.patch(update_url, headers=notion_headers, json=payload)
-    if update_response.status_code == 200:
-        print(f"{emoji}🔄 '{title}' updated in Notion.")
-    else:
-        requests.patch(update_url, headers=notion_headers,
-                                         json={"properties": {"Update": {"select": {"name": "Yes"}}}})
-        print(f"{emoji}❌ Error updating '{title}': {json.dumps(update_response.json(), indent=4)}")
+    from modules import matching
+    return matching.title_similarity(title1, title2)
@@ -0,0 +1,78 @@
+# Notion databases updated by one run (one per household), sharing the workers, rate limits and search results
+import os
+import json
+
+from modules import client, config
+
+
+class Database:
+    """
+    One Notion database and the integration token used to read and write it
+    """
+    def __init__(self, name, database_id, token):
+        self.name        = name
+        self.database_id = database_id
+        self.token       = token
+        self.headers     = {**config.notion_headers, "Authorization": f"Bearer {token}"}
+
+
+def load(path=None):
+    """
+    Databases listed in DATABASES_FILE, or the one given by DATABASE_ID and NOTION_TOKEN when there's no such file
+
+    The file is a JSON list of {"name", "database_id", "token"} objects, where "token_env" can name the environment
+    variable holding the token instead of writing it in the file.
+    """
+    path = path or config.DATABASES_FILE
+    if not path or not os.path.exists(path):
+        return [Database("default", config.DATABASE_ID, config.NOTION_TOKEN)]
+
+    with open(path, encoding="utf-8") as file:
+        items = json.load(file)
+    databases = []
+    for number, item in enumerate(items, 1):
+        name = item.get("name") or f"database {number}"
+        token = item.get("token") or (os.getenv(item["token_env"]) if item.get("token_env") else None)
+        if not item.get("database_id") or not token:
+            print(f"Skipping {name} of {path}: it needs a database_id and a token (or token_env)")
+            continue
+        databases.append(Database(name, item["database_id"], token))
+    return databases
+
+
+def interleave(iterators):
+    """
+    Yield the items of every iterator in turns, so every database gets the same share of the workers and of the
+    rate limits of the APIs, whatever its size
+    """
+    iterators = list(iterators)
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+
+async def interleave_async(iterators):
+    iterators = list(iterators)
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield await iterator.__anext__()
+            except StopAsyncIteration:
+                iterators.remove(iterator)
+
+
+def search_key(entry):
+    """
+    Entries with the same key (type, title ignoring case and punctuation, release date) share their search, even when
+    they're in different databases
+    """
+    from modules import matching
+    return entry["type"], matching.normalize(entry["title"]), entry.get("release_date") or ""
+
+
+# Entries with the same search_key searching at the same time share one search, the entries that come later search
+# again and get their responses from the cache
+shared_searches = client.SingleFlight()
@@ -0,0 +1,82 @@
+# Runs the independent calls of one entry at the same time (search languages, IGDB and RAWG)
+import threading
+import concurrent.futures
+
+from modules import config
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool used only for the calls fanned out by a worker, separate from the main pool so workers never wait on
+    tasks stuck behind themselves
+    """
+    global _executor
+    if not _executor:
+        with _executor_lock:
+            if not _executor:
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.FANOUT_WORKERS,
+                                                                  thread_name_prefix="fanout")
+    return _executor
+
+
+def _result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Error in parallel call: {e}")
+        return None
+
+
+def run_all(*calls):
+    """
+    Run every call at the same time and return their results in order, None for the ones that failed
+    """
+    futures = [get_executor().submit(call) for call in calls]
+    return [_result(future) for future in futures]
+
+
+def first_good(*calls):
+    """
+    Run every call at the same time and return the first result that isn't empty, None if they all are
+
+    The calls still running when an answer is found are left to finish in the background.
+    """
+    futures = [get_executor().submit(call) for call in calls]
+    for future in concurrent.futures.as_completed(futures):
+        result = _result(future)
+        if result:
+            return result
+    return None
+
+
+async def run_all_async(*coros):
+    import asyncio
+
+    results = await asyncio.gather(*coros, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error in parallel call: {result}")
+    return [None if isinstance(result, Exception) else result for result in results]
+
+
+async def first_good_async(*coros):
+    import asyncio
+
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except Exception as e:
+                print(f"Error in parallel call: {e}")
+                continue
+            if result:
+                return result
+        return None
+    finally:
+        # Calls that lost the race are cancelled, there's no thread to wait for
+        for task in tasks:
+            task.cancel()
@@ -1,53 +1,225 @@
+import json
+import threading
 from urllib.parse import quote
-from modules.config import *
+from concurrent.futures import Future
+from modules.config import (RAWG_API_KEY, IGDB_CLIENT_ID, IGDB_CLIENT_SECRET, CACHE_TTL_SEARCH, CACHE_TTL_RELEASED,
+                            CACHE_TTL_DEFAULT, CACHE_TTL_EMPTY, IGDB_BATCH_SIZE, igdb_headers, choose_best_result)
+from modules import cache, client, config, memo
+from modules.steps import Call, First, All, Token
+from modules.tokens import TokenManager
 
 from datetime import datetime
 
-igdb_token = None
+IGDB_GAMES_URL      = "https://api.igdb.com/v4/games"
+IGDB_MULTIQUERY_URL = "https://api.igdb.com/v4/multiquery"
+
+# Games queries answered by a multiquery batch and not searched yet, igdb_candidates takes them out instead of sending
+# them (later searches of the same query find it in the response cache)
+prefetched = {}
+
+def igdb_token_url():
+    return (f"https://id.twitch.tv/oauth2/token?client_id={IGDB_CLIENT_ID}"
+            f"&client_secret={IGDB_CLIENT_SECRET}"
+            f"&grant_type=client_credentials")
+
+IGDB_FIELDS = ('fields total_rating,'
+                      'total_rating_count,'
+                      'name,'
+                      'summary,'
+                      'rating,'
+                      'cover.url,'
+                      'storyline,'
+                      'genres.name,'
+                      'artworks.url,'
+                      'platforms.name,'
+                      'aggregated_rating,'
+                      'first_release_date,'
+                      'involved_companies.developer,'
+                      'involved_companies.publisher,'
+                      'involved_companies.company.name;')
+
+def igdb_search_query(title):
+    # Construct the search for IGDB
+    return f'search "{title}";' + IGDB_FIELDS
+
+def igdb_id_query(game_id):
+    # Fetch a game already matched in a previous run
+    return IGDB_FIELDS + f'where id = {game_id};'
+
+igdb_token = TokenManager("igdb", igdb_token_url)
+
+def igdb_auth_headers(token):
+    return dict(igdb_headers, Authorization=f"Bearer {token}")
 
-def search_igdb_game(title, release_date=None):
+def igdb_post(url, query, **kwargs):
     """
-    Search for a game using the IGDB API
+    Step POSTing a query to IGDB, getting a new token and trying again once if IGDB rejects the current one
     """
+    for attempt in range(2):
+        token = yield Token(igdb_token)
+        response = yield Call("POST", url, headers=igdb_auth_headers(token), data=query, **kwargs)
+        if response.status_code != 401:
+            break
+        igdb_token.invalidate(token)
+    return response
+
+def igdb_games_query(title, game_id=None):
+    return igdb_id_query(game_id) if game_id else igdb_search_query(title)
+
+def igdb_entry_query(title, page_id=None):
+    """
+    The first IGDB games query find_game will send for a Notion entry, None if it won't start with IGDB
+    """
+    known = memo.lookup(page_id, title, "Game") or {}
+    if known.get("source") == "rawg":
+        return None
+    return igdb_games_query(title, known.get("external_id") if known.get("source") == "igdb" else None)
 
-    global igdb_token, igdb_headers
+def multiquery_body(queries):
+    # Each query is named after its position, to match the results back to it
+    return "\n".join(f'query games "{i}" {{ {query} }};' for i, query in enumerate(queries))
 
-    # Get a token if there's none
-    if not igdb_token:
-        url = (f"https://id.twitch.tv/oauth2/token?client_id={IGDB_CLIENT_ID}"
-               f"&client_secret={IGDB_CLIENT_SECRET}"
-               f"&grant_type=client_credentials")
-        response = requests.post(url)
-        igdb_token = response.json().get("access_token")
-        igdb_headers["Authorization"] = f"Bearer {igdb_token}"
+def queries_to_send(queries):
+    """
+    Remove the duplicated queries and the ones that are already prefetched or in the response cache
+    """
+    return [query for query in dict.fromkeys(queries)
+            if query not in prefetched and not client.cached_response("POST", IGDB_GAMES_URL, query)]
 
-    # Construct the search for IGDB
-    query = (f'search "{title}";'
-             f'fields total_rating,'
-                    f'total_rating_count,'
-                    f'name,'
-                    f'summary,'
-                    f'rating,'
-                    f'cover.url,'
-                    f'storyline,'
-                    f'genres.name,'
-                    f'artworks.url,'
-                    f'platforms.name,'
-                    f'aggregated_rating,'
-                    f'first_release_date,'
-                    f'involved_companies.developer,'
-                    f'involved_companies.publisher,'
-                    f'involved_companies.company.name;')
-
-    url = "https://api.igdb.com/v4/games"
-    response = requests.post(url, headers=igdb_headers, data=query)
+def save_multiquery(queries, response):
+    """
+    Keep the games found by each query of a multiquery response, for igdb_candidates and in the response cache
+    as if each query had been sent to /v4/games on its own
+    """
+    if response.status_code != 200:
+        print(f"Error batching IGDB queries: {response.status_code}")
+        return
+    for item in response.json():
+        query = queries[int(item["name"])]
+        games = item.get("result", [])
+        prefetched[query] = games
+        cache.store("POST", IGDB_GAMES_URL, query,
+                    client.build_response(IGDB_GAMES_URL, 200, json.dumps(games).encode()), igdb_games_ttl)
+
+def rawg_search_url(search_query):
+    return f"https://api.rawg.io/api/games?key={RAWG_API_KEY}&search={quote(search_query)}&page_size=10"
+
+def rawg_detail_url(game_id):
+    return f"https://api.rawg.io/api/games/{game_id}?key={RAWG_API_KEY}"
+
+def igdb_games_ttl(response):
+    # The games query returns the full details, keep it longer when every game is already out, and not for long when
+    # IGDB doesn't list the game yet
+    games = response.json()
+    if not games:
+        return CACHE_TTL_EMPTY
+    now = datetime.now().timestamp()
+    if all(game.get("first_release_date", now) < now for game in games):
+        return CACHE_TTL_RELEASED
+    return CACHE_TTL_DEFAULT
+
+def rawg_search_ttl(response):
+    if response.json().get("results"):
+        return CACHE_TTL_SEARCH
+    return CACHE_TTL_EMPTY
+
+def rawg_detail_ttl(response):
+    data = response.json()
+    released = data.get("released")
+    if released and not data.get("tba") and released <= datetime.now().strftime("%Y-%m-%d"):
+        return CACHE_TTL_RELEASED
+    return CACHE_TTL_DEFAULT
+
+def igdb_candidates(title, game_id=None):
+    """
+    Return the IGDB games found for a title, or the game with a known IGDB ID
+    """
+    query = igdb_games_query(title, game_id)
+    games = prefetched.pop(query, None)
+    if games is not None:
+        return games
+
+    response = yield from igdb_post(IGDB_GAMES_URL, query, cache_ttl=igdb_games_ttl)
 
     if response.status_code == 200:
-        data = response.json()
-        if data:
-            data = choose_best_result(data, title, release_date)
-            return process_igdb_game(data)
+        return response.json()
+    return []
 
+def prefetch_igdb(queries):
+    """
+    Step sending IGDB games queries IGDB_BATCH_SIZE at a time through /v4/multiquery, see IgdbBatch
+    """
+    queries = queries_to_send(queries)
+    for start in range(0, len(queries), IGDB_BATCH_SIZE):
+        batch = queries[start:start + IGDB_BATCH_SIZE]
+        try:
+            response = yield from igdb_post(IGDB_MULTIQUERY_URL, multiquery_body(batch))
+            save_multiquery(batch, response)
+        except Exception as e:
+            print(f"Error batching IGDB queries: {str(e)}")
+
+class IgdbBatch:
+    """
+    Groups the first IGDB query of the game entries found in the Notion scan, to send them IGDB_BATCH_SIZE at a time
+    through /v4/multiquery
+
+    The future returned by submit() is done once the batch of the entry was answered, the search of the entry then
+    runs as usual and finds its games in `prefetched` (or sends its own query if the batch failed).
+
+    Args:
+        start: Runs a step in the background and returns its future, on the executor (thread engine) or as a task
+        new_future: Creates the futures handed out by submit(), asyncio ones for the asyncio engine
+    """
+    def __init__(self, start, new_future=Future):
+        self.start      = start
+        self.new_future = new_future
+        self.lock       = threading.Lock()
+        self.queries    = []
+        self.futures    = []
+        self.running    = set()
+
+    def submit(self, title, page_id=None):
+        future = self.new_future()
+        query = igdb_entry_query(title, page_id)
+        if not query:
+            future.set_result(None)
+            return future
+
+        with self.lock:
+            # The same game in several databases is only asked once
+            if query not in self.queries:
+                self.queries.append(query)
+            self.futures.append(future)
+            full = len(self.queries) >= IGDB_BATCH_SIZE
+        if full:
+            self.flush()
+        return future
+
+    def flush(self):
+        """
+        Send the queries gathered so far, called when a batch is full and at the end of the Notion scan
+        """
+        with self.lock:
+            queries, futures = self.queries, self.futures
+            self.queries, self.futures = [], []
+        if not queries:
+            return
+
+        def release(batch):
+            self.running.discard(batch)
+            for future in futures:
+                future.set_result(None)
+        batch = self.start(prefetch_igdb(queries))
+        self.running.add(batch)
+        batch.add_done_callback(release)
+
+def search_igdb_game(title, release_date=None, game_id=None):
+    """
+    Search for a game using the IGDB API, or fetch it directly when its IGDB ID is already known
+    """
+    data = yield from igdb_candidates(title, game_id)
+    if data:
+        return process_igdb_game(choose_best_result(data, title, release_date))
     return None
 
 def process_igdb_game(data):
@@ -121,6 +293,8 @@ def process_igdb_game(data):
                 bg_img = screenshot_url
 
     return {
+        "id":               data.get('id'),
+        "source":           "igdb",
         "status":           status,
         "genres":           genres,
         "title":            data.get('name', ''),
@@ -174,6 +348,8 @@ def process_rawg_game(game_data):
         cover = game_data.get('background_image')
 
     return {
+        "id":             game_data.get('id'),
+        "source":         "rawg",
         "title":          game_data.get('name', ''),
         "rating":         game_data.get('rating', 0)*2,
         "genres":         genres,
@@ -186,32 +362,84 @@ def process_rawg_game(game_data):
         "background":     game_data.get('background_image', ''),
     }
 
-def search_game(search_query, release_date=None):
+def rawg_candidates(search_query):
+    rawg_response = yield Call("GET", rawg_search_url(search_query), cache_ttl=rawg_search_ttl)
+    return rawg_response.json().get("results") or []
+
+def get_rawg_game(game_id):
+    detail_response = yield Call("GET", rawg_detail_url(game_id), cache_ttl=rawg_detail_ttl)
+    if detail_response.status_code != 200:
+        return None
+    return process_rawg_game(detail_response.json())
+
+def search_rawg_game(search_query, release_date=None):
+    try:
+        results = yield from rawg_candidates(search_query)
+        if results:
+            game_data = choose_best_result(results, search_query, release_date)
+            return (yield from get_rawg_game(game_data["id"]))
+        return None
+    except Exception as e:
+        print(f"Error searching RAWG: {str(e)}")
+        return None
+
+def try_igdb_game(search_query, release_date=None, game_id=None):
     try:
-        game_data = search_igdb_game(search_query, release_date)
+        return (yield from search_igdb_game(search_query, release_date, game_id))
+    except Exception as e:
+        print(f"Error searching IGDB: {str(e)}")
+        return None
+
+def rank_game_sources(search_query, release_date=None):
+    """
+    Search IGDB and RAWG at the same time and pick the best match among the results of both
+    """
+    igdb_results, rawg_results = yield All(igdb_candidates(search_query), rawg_candidates(search_query))
+    candidates = ([dict(game, source="igdb") for game in igdb_results or []] +
+                  [dict(game, source="rawg") for game in rawg_results or []])
+    best = choose_best_result(candidates, search_query, release_date)
+    if not best:
+        return None
+    if best["source"] == "igdb":
+        return process_igdb_game(best)
+    return (yield from get_rawg_game(best["id"]))
+
+def find_game(search_query, release_date=None, known=None):
+    """
+    Look for a game in IGDB and RAWG, following GAME_SOURCE_POLICY:
+        "fallback": IGDB first, RAWG only if IGDB has nothing
+        "first":    both at the same time, the first good answer wins
+        "rank":     both at the same time, the best match among all results wins
+    """
+    known = known or {}
+    if known.get("source") == "rawg":
+        game_data = yield from get_rawg_game(known["external_id"])
+        if game_data:
+            return game_data
+    elif known.get("source") == "igdb":
+        game_data = yield from try_igdb_game(search_query, release_date, known["external_id"])
         if game_data:
             return game_data
-    except Exception as e:
-        print(f"Error searching IGDB: {str(e)}, searching RAWG...")
-    print("Game not found in IGDB, searching RAWG...")
 
+    if config.GAME_SOURCE_POLICY == "first":
+        return (yield First(try_igdb_game(search_query, release_date), search_rawg_game(search_query, release_date)))
+    if config.GAME_SOURCE_POLICY == "rank":
+        return (yield from rank_game_sources(search_query, release_date))
 
     try:
-        rawg_url = f"https://api.rawg.io/api/games?key={RAWG_API_KEY}&search={quote(search_query)}&page_size=10"
-        rawg_response = requests.get(rawg_url, timeout=10)
-        rawg_data = rawg_response.json()
-
-        if rawg_data.get("results") and len(rawg_data["results"]) > 0:
-            game_data = choose_best_result(rawg_data["results"], search_query, release_date)
-            game_id = game_data["id"]
-            detail_url = f"https://api.rawg.io/api/games/{game_id}?key={RAWG_API_KEY}"
-            detail_response = requests.get(detail_url, timeout=10)
-            game_details = detail_response.json()
-
-            game_data = process_rawg_game(game_details)
+        game_data = yield from search_igdb_game(search_query, release_date)
+        if game_data:
             return game_data
-        return None
     except Exception as e:
-        print(f"Error searching RAWG: {str(e)}")
-        return None
+        print(f"Error searching IGDB: {str(e)}, searching RAWG...")
+    print("Game not found in IGDB, searching RAWG...")
+    return (yield from search_rawg_game(search_query, release_date))
 
+def search_game(search_query, release_date=None, page_id=None):
+    """
+    Step searching a game in IGDB and RAWG, starting from the item this page was matched to in a previous run
+    """
+    game_data = yield from find_game(search_query, release_date, memo.lookup(page_id, search_query, "Game"))
+    if game_data:
+        memo.remember(page_id, search_query, "Game", game_data["title"], game_data["source"], game_data["id"])
+    return game_data
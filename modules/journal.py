@@ -0,0 +1,68 @@
+# Journal of what happened to each entry of the last run, so a run that was interrupted can be resumed
+import time
+
+from modules import state
+
+state.create_table("""journal (
+                          page_id TEXT PRIMARY KEY,
+                          title   TEXT,
+                          state   TEXT,
+                          error   TEXT,
+                          updated REAL)""")
+state.create_table("""runs (
+                          name     TEXT PRIMARY KEY,
+                          started  REAL,
+                          finished REAL)""")
+
+# States of an entry, in order: queued (submitted to a worker), fetched (found and its details downloaded, the best
+# match being ranked along the way) and written (Notion is up to date), or failed with the error in the journal
+STATES = ["queued", "fetched", "written", "failed"]
+
+_done = set()
+
+
+def start(resume=False):
+    """
+    Start the journal of a run, returns True if it resumes the previous one
+
+    With resume, and when the previous run didn't finish, its journal is kept and the entries it already wrote are
+    skipped (see done). Otherwise the journal starts empty.
+    """
+    row = state.fetchone("SELECT finished FROM runs WHERE name = 'last'")
+    resuming = bool(resume and row and row[0] is None)
+    _done.clear()
+    if resuming:
+        _done.update(pages("written"))
+    else:
+        state.execute("DELETE FROM journal")
+        state.execute("INSERT OR REPLACE INTO runs VALUES ('last', ?, NULL)", (time.time(),))
+    return resuming
+
+def finish():
+    state.execute("UPDATE runs SET finished = ? WHERE name = 'last'", (time.time(),))
+
+def done(page_id):
+    """
+    True if the run being resumed already wrote this entry
+    """
+    return page_id in _done
+
+def mark(page_id, entry_state, title=None, error=None):
+    if not page_id:
+        return
+    state.execute("INSERT INTO journal VALUES (?, ?, ?, ?, ?) "
+                  "ON CONFLICT(page_id) DO UPDATE SET title = COALESCE(excluded.title, title), "
+                  "state = excluded.state, error = excluded.error, updated = excluded.updated",
+                  (page_id, title, entry_state, error, time.time()))
+
+def pages(entry_state):
+    """
+    IDs of the pages of the journal in a state
+    """
+    return [page_id for page_id, in state.fetchall("SELECT page_id FROM journal WHERE state = ?", (entry_state,))]
+
+def counts():
+    """
+    Number of entries of the journal in each state
+    """
+    return dict(state.fetchall("SELECT state, COUNT(*) FROM journal GROUP BY state"))
@@ -0,0 +1,134 @@
+# Title matching used to rank search results, see benchmarks/title_matching.py for its accuracy against difflib
+import re
+from functools import lru_cache
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz.distance import Indel
+    from rapidfuzz.process import cdist
+except ImportError:
+    Indel = None
+    cdist = None
+
+# Below this many candidates, calling Indel in a loop is faster than setting up a cdist batch
+CDIST_MIN_BATCH = 100
+
+_punctuation = re.compile(r'[^\w\s]')
+_spaces      = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=8192)
+def normalize(title):
+    """
+    Lowercase a title, remove special characters and extra spaces (cached, titles repeat a lot between searches)
+    """
+    return _spaces.sub(' ', _punctuation.sub('', (title or "").lower())).strip()
+
+
+def char_masks(text):
+    """
+    Bit mask of the positions of each character of a text, used by lcs_length
+    """
+    masks = {}
+    for i, char in enumerate(text):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def lcs_length(masks, length, other):
+    """
+    Length of the longest common subsequence between a text (given by its char_masks and length) and `other`
+
+    Bit-parallel algorithm (Hyyrö, 2004): one pass over `other` with a few integer operations per character.
+    """
+    full = (1 << length) - 1
+    row = full
+    for char in other:
+        matches = row & masks.get(char, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return length - bin(row).count("1")
+
+
+def _ratio(norm1, norm2, masks=None):
+    if not norm1 and not norm2:
+        return 1.0
+    if Indel:
+        return Indel.normalized_similarity(norm1, norm2)
+    masks = masks if masks is not None else char_masks(norm1)
+    return 2 * lcs_length(masks, len(norm1), norm2) / (len(norm1) + len(norm2))
+
+
+def _finish(norm1, norm2, ratio):
+    # Check for an exact match first
+    if norm1 == norm2:
+        return 1.0
+    # Give bonus for containment
+    if norm1 in norm2 or norm2 in norm1:
+        ratio = (ratio + 0.3) / 1.3
+    return ratio
+
+
+class TitleMatcher:
+    """
+    Scores candidate titles against one target title, normalizing the target only once
+
+    The score is the same as calculate_title_similarity: 1 for an exact match, otherwise a 0-1 similarity with a
+    bonus when one title contains the other. The similarity is based on the longest common subsequence (rapidfuzz's
+    Indel when installed, a pure Python bit-parallel version otherwise) instead of difflib's SequenceMatcher.
+    """
+    def __init__(self, target):
+        self.target = normalize(target)
+        self.masks  = char_masks(self.target)
+
+    def score(self, title):
+        norm = normalize(title)
+        return _finish(self.target, norm, _ratio(self.target, norm, self.masks))
+
+    def score_many(self, titles):
+        """
+        Score a list of titles at once, in a single vectorized call for large lists when rapidfuzz is installed
+        """
+        norms = [normalize(title) for title in titles]
+        if cdist and self.target and len(norms) >= CDIST_MIN_BATCH:
+            ratios = cdist([self.target], norms, scorer=Indel.normalized_similarity)[0]
+        else:
+            ratios = [_ratio(self.target, norm, self.masks) for norm in norms]
+        return [_finish(self.target, norm, float(ratio)) for norm, ratio in zip(norms, ratios)]
+
+
+def title_similarity(title1, title2):
+    return TitleMatcher(title1).score(title2)
+
+
+def legacy_title_similarity(title1, title2):
+    """
+    The original difflib based score, kept to measure the ranking accuracy of TitleMatcher
+    """
+    norm1, norm2 = normalize(title1), normalize(title2)
+    return _finish(norm1, norm2, SequenceMatcher(None, norm1, norm2).ratio())
+
+
+def ranking_agreement(cases, scorer=title_similarity, reference=legacy_title_similarity):
+    """
+    Compare two title scorers over (target, candidate titles) cases
+
+    Returns:
+        A dict with the share of cases where both pick the same best title ("top1"), and the mean and maximum
+        absolute difference between their scores
+    """
+    same_top, diffs = 0, []
+    for target, candidates in cases:
+        if not candidates:
+            continue
+        scores = [scorer(target, title) for title in candidates]
+        references = [reference(target, title) for title in candidates]
+        same_top += scores.index(max(scores)) == references.index(max(references))
+        diffs += [abs(a - b) for a, b in zip(scores, references)]
+
+    total = sum(1 for _, candidates in cases if candidates)
+    return {
+        "cases":     total,
+        "top1":      same_top / total if total else 1.0,
+        "mean_diff": sum(diffs) / len(diffs) if diffs else 0.0,
+        "max_diff":  max(diffs, default=0.0),
+    }
@@ -0,0 +1,45 @@
+# Remembers which TMDB/IGDB/RAWG/Goodreads item each Notion page resolved to, so later runs skip the search
+from modules import cache, state
+
+state.create_table("""resolved (
+                          page_id        TEXT PRIMARY KEY,
+                          query          TEXT,
+                          resolved_title TEXT,
+                          source         TEXT,
+                          external_id    TEXT,
+                          language       TEXT,
+                          media_type     TEXT)""")
+state.add_column("resolved", "media_type TEXT")
+
+
+def lookup(page_id, title, media_type):
+    """
+    Return {"source", "external_id", "language"} for a page, or None if it was never resolved
+
+    The page's current title has to be either the one that was searched or the one that was written back to
+    Notion, and its type the one it had then (TMDB movie and series IDs are different items), otherwise the page was
+    changed by hand and the old match is forgotten.
+    """
+    if not page_id or cache.mode != "on":
+        return None
+
+    row = state.fetchone("SELECT query, resolved_title, source, external_id, language, media_type FROM resolved "
+                         "WHERE page_id = ?", (page_id,))
+    if not row:
+        return None
+    if title not in (row[0], row[1]) or media_type != row[5]:
+        forget(page_id)
+        return None
+    return {"source": row[2], "external_id": row[3], "language": row[4]}
+
+
+def remember(page_id, query, media_type, resolved_title, source, external_id, language=None):
+    if not page_id:
+        return
+    state.execute("INSERT OR REPLACE INTO resolved (page_id, query, resolved_title, source, external_id, language, "
+                  "media_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  (page_id, query, resolved_title, source, str(external_id), language, media_type))
+
+
+def forget(page_id):
+    state.execute("DELETE FROM resolved WHERE page_id = ?", (page_id,))
@@ -0,0 +1,219 @@
+# Counters and timings of a run, written as a JSON report (and optionally a Prometheus textfile) at the end
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from modules import config, ratelimit
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+_lock    = threading.Lock()
+_started = time.time()
+_calls   = {}   # (api, endpoint) -> counters and latency samples of the calls to that endpoint
+_stages  = {}   # stage -> duration samples
+_counts  = {}   # name -> counter (entries found, skipped, errors...)
+
+_id_segment = re.compile(r'\d')
+
+
+def reset():
+    global _started
+    with _lock:
+        _started = time.time()
+        _calls.clear()
+        _stages.clear()
+        _counts.clear()
+
+
+def endpoint_of(method, url):
+    """
+    "METHOD /path" of a URL, with the IDs in the path replaced by :id so calls to the same endpoint add up
+
+    Any segment with a digit is an ID, except the first one (the API version, as in /3/ or /v1/).
+    """
+    segments = urlsplit(url).path.split("/")
+    segments[2:] = [":id" if _id_segment.search(segment) else segment for segment in segments[2:]]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+def _endpoint(method, url):
+    api = ratelimit.api_for_url(url) or urlsplit(url).netloc
+    key = (api, endpoint_of(method, url))
+    if key not in _calls:
+        _calls[key] = {"calls": 0, "cache_hits": 0, "retries": 0, "errors": 0, "rate_wait": 0.0, "statuses": {},
+                       "latencies": []}
+    return _calls[key]
+
+
+def record_call(method, url, status, seconds, retries=0, rate_wait=0.0):
+    """
+    Record a call sent to an API, status is the final HTTP status or None when it ended with a connection error
+    """
+    with _lock:
+        endpoint = _endpoint(method, url)
+        endpoint["calls"]     += 1
+        endpoint["retries"]   += retries
+        endpoint["rate_wait"] += rate_wait
+        endpoint["latencies"].append(seconds)
+        if status is None:
+            endpoint["errors"] += 1
+        else:
+            endpoint["statuses"][str(status)] = endpoint["statuses"].get(str(status), 0) + 1
+
+
+def record_cache_hit(method, url):
+    with _lock:
+        _endpoint(method, url)["cache_hits"] += 1
+
+
+def record_stage(stage, seconds):
+    with _lock:
+        _stages.setdefault(stage, []).append(seconds)
+
+
+def count(name, amount=1):
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + amount
+
+
+@contextmanager
+def timed(stage):
+    """
+    Record how long the block takes as one sample of `stage`
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.monotonic() - start)
+
+
+def queued(fn):
+    """
+    Wrap a function to record, as a "queue_wait" sample, how long it waits between now and its call
+    """
+    start = time.monotonic()
+
+    def run(*args, **kwargs):
+        record_stage("queue_wait", time.monotonic() - start)
+        return fn(*args, **kwargs)
+    return run
+
+
+def summarize(samples):
+    """
+    Count, total, mean, max and QUANTILES of a list of durations
+    """
+    ordered = sorted(samples)
+    summary = {"count": len(ordered), "total": sum(ordered), "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+               "max": ordered[-1] if ordered else 0.0}
+    for quantile in QUANTILES:
+        summary[f"p{round(quantile * 100)}"] = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] \
+                                                if ordered else 0.0
+    return summary
+
+
+def report():
+    """
+    Everything recorded since the start of the run, grouped by API and endpoint
+    """
+    with _lock:
+        apis = {}
+        for (api, endpoint), data in sorted(_calls.items()):
+            totals = apis.setdefault(api, {"calls": 0, "cache_hits": 0, "retries": 0, "errors": 0, "rate_wait": 0.0,
+                                           "statuses": {}, "endpoints": {}})
+            for name in ["calls", "cache_hits", "retries", "errors", "rate_wait"]:
+                totals[name] += data[name]
+            for status, amount in data["statuses"].items():
+                totals["statuses"][status] = totals["statuses"].get(status, 0) + amount
+            totals["endpoints"][endpoint] = {**{name: value for name, value in data.items() if name != "latencies"},
+                                             "latency": summarize(data["latencies"])}
+
+        return {
+            "started":  datetime.fromtimestamp(_started, timezone.utc).isoformat(),
+            "duration": time.time() - _started,
+            "counts":   dict(_counts),
+            "stages":   {stage: summarize(samples) for stage, samples in sorted(_stages.items())},
+            "apis":     apis,
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus(data):
+    """
+    The report in the Prometheus text format, for node_exporter's textfile collector
+    """
+    prefix = "notion_media"
+    families = {name: (kind, []) for name, kind in [
+        ("run_duration_seconds",        "gauge"),
+        ("run_count",                   "gauge"),
+        ("api_calls_total",             "counter"),
+        ("api_cache_hits_total",        "counter"),
+        ("api_retries_total",           "counter"),
+        ("api_rate_wait_seconds_total", "counter"),
+        ("api_latency_seconds",         "summary"),
+        ("stage_seconds",               "summary"),
+    ]}
+
+    def add(name, labels, value):
+        families[name][1].append(f"{prefix}_{name}{{{labels}}} {value}" if labels else f"{prefix}_{name} {value}")
+
+    add("run_duration_seconds", "", f"{data['duration']:.3f}")
+    for name, value in data["counts"].items():
+        add("run_count", f'name="{_label(name)}"', value)
+
+    for api, totals in data["apis"].items():
+        for endpoint, stats in totals["endpoints"].items():
+            labels = f'api="{_label(api)}",endpoint="{_label(endpoint)}"'
+            for status, amount in stats["statuses"].items():
+                add("api_calls_total", f'{labels},status="{status}"', amount)
+            if stats["errors"]:
+                add("api_calls_total", f'{labels},status="error"', stats["errors"])
+            add("api_cache_hits_total", labels, stats["cache_hits"])
+            add("api_retries_total", labels, stats["retries"])
+            add("api_rate_wait_seconds_total", labels, f"{stats['rate_wait']:.6f}")
+            families["api_latency_seconds"][1].extend(_summary(f"{prefix}_api_latency_seconds", labels,
+                                                               stats["latency"]))
+
+    for stage, stats in data["stages"].items():
+        families["stage_seconds"][1].extend(_summary(f"{prefix}_stage_seconds", f'stage="{_label(stage)}"', stats))
+
+    # Every line of a metric has to come right after its TYPE line
+    lines = []
+    for name, (kind, samples) in families.items():
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines += samples
+    return "\n".join(lines) + "\n"
+
+
+def _summary(name, labels, stats):
+    lines = [f'{name}{{{labels},quantile="{quantile}"}} {stats[f"p{round(quantile * 100)}"]:.6f}'
+             for quantile in QUANTILES]
+    return lines + [f"{name}_sum{{{labels}}} {stats['total']:.6f}", f"{name}_count{{{labels}}} {stats['count']}"]
+
+
+def write_report(path=None, prometheus_path=None):
+    """
+    Write the JSON report of the run, and the Prometheus textfile if a path is given for it
+    """
+    data = report()
+    path = path or config.METRICS_REPORT
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+    prometheus_path = prometheus_path or config.PROMETHEUS_TEXTFILE
+    if prometheus_path:
+        # Written next to the target and renamed, so the collector never reads a half written file
+        with open(f"{prometheus_path}.tmp", "w") as file:
+            file.write(prometheus(data))
+        os.replace(f"{prometheus_path}.tmp", prometheus_path)
+    return data
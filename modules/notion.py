@@ -0,0 +1,234 @@
+# Helpers shared by every engine to read and write the Notion database
+from datetime import datetime, timedelta, timezone
+
+from modules import cache, client, config, state
+from modules.steps import Call
+
+TERMINAL_STATUSES = ["Released", "Ended", "Canceled"]
+
+state.create_table("""sync (
+                          database_id TEXT PRIMARY KEY,
+                          watermark   TEXT)""")
+state.create_table("""page_images (
+                          page_id TEXT,
+                          url     TEXT,
+                          PRIMARY KEY (page_id, url))""")
+
+
+PAGES_URL = "https://api.notion.com/v1/pages"
+
+
+def database_query_url(database_id=None):
+    return f"https://api.notion.com/v1/databases/{database_id or config.DATABASE_ID}/query"
+
+def due_filter(since=None):
+    """
+    Notion filter matching the pages parse_notion_page keeps, so the others are never downloaded
+
+    Pages marked "Update: Yes" and series/titles with a non-terminal status are always due. Pages that are due
+    only because their Update or Status is still empty (usually new rows) must also have been edited after
+    `since`, the start of the last complete run.
+    """
+    edited = [{"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}] if since else []
+    has_type = {"property": "Type", "select": {"is_not_empty": True}}
+    return {"or": [
+        {"property": "Update", "select": {"equals": "Yes"}},
+        {"and": edited + [{"property": "Update", "select": {"is_empty": True}}]},
+        {"and": edited + [has_type, {"property": "Status", "select": {"is_empty": True}}]},
+        {"and": [has_type, {"property": "Status", "select": {"is_not_empty": True}}] +
+                [{"property": "Status", "select": {"does_not_equal": status}} for status in TERMINAL_STATUSES]},
+    ]}
+
+def query_payload(start_cursor=None, incremental=False, since=None):
+    payload = {"page_size": 100}
+    if start_cursor:
+        payload["start_cursor"] = start_cursor
+    if incremental:
+        payload["filter"] = due_filter(since)
+    return payload
+
+def entries_page(database=None, incremental=False, since=None, start_cursor=None):
+    """
+    Step reading one page of the database's entries, returns the entries to update (see parse_notion_page) and the
+    cursor of the next page, None after the last one
+
+    Entries of another database than the default one carry its Notion headers.
+    """
+    database_id = database.database_id if database else None
+    headers = database.headers if database else config.notion_headers
+    response = yield Call("POST", database_query_url(database_id), headers=headers,
+                          json=query_payload(start_cursor, incremental, since))
+    data = response.json()
+
+    entries = []
+    for page in data.get("results", []):
+        entry = parse_notion_page(page)
+        if entry:
+            entry["headers"] = headers
+            entries.append(entry)
+    return entries, data["next_cursor"] if data.get("has_more") else None
+
+def load_watermark(database_id=None):
+    row = state.fetchone("SELECT watermark FROM sync WHERE database_id = ?", (database_id or config.DATABASE_ID or "",))
+    return row[0] if row else None
+
+def save_watermark(watermark, database_id=None):
+    state.execute("INSERT OR REPLACE INTO sync VALUES (?, ?)", (database_id or config.DATABASE_ID or "", watermark))
+
+def new_watermark():
+    """
+    Watermark for a run starting now, one minute early since Notion rounds last_edited_time to the minute
+    """
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(minutes=1)
+    return start.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def parse_notion_page(page):
+    """
+    Return the entry of a Notion page if it needs to be updated, None otherwise
+    """
+    title_prop          = page["properties"].get("Name", {})            .get("title", [])
+    type_prop           = page["properties"].get("Type", {})            .get("select", {})
+    release_date_prop   = page["properties"].get("Release date", {})    .get("date", {})
+    update              = page["properties"].get("Update",{})           .get("select",{})
+    status              = page["properties"].get("Status",{})           .get("select",{})
+    next_air_date       = page["properties"].get("Next air date", {})   .get("date", {})
+    page_id             = page["id"]
+
+    if type_prop and status:
+        if  status.get("name") not in TERMINAL_STATUSES:
+            update = True
+    elif type_prop and not status:
+        update = True
+
+    if update and (type(update) != bool):
+        update = update.get("name")
+        if update == "Yes":
+            update = True
+        else:
+            update = False
+    else:
+        update = True
+    if title_prop and update:
+        name = title_prop[0]["text"]["content"]
+        media_type = type_prop.get("name") if type_prop else None
+        release_date = release_date_prop.get("start") if release_date_prop else None
+        return {
+            "title": name,
+            "type": media_type,
+            "release_date": release_date,
+            "page_id": page_id,
+            "current": {"properties": page["properties"], "cover": page.get("cover")}
+        }
+    return None
+
+PROPERTY_TYPES = ["title", "rich_text", "select", "multi_select", "number", "date", "files"]
+
+def property_value(prop):
+    """
+    Comparable value of a Notion property, the same for the payload we send and for what Notion returns
+    """
+    if not prop:
+        return None
+    kind = prop.get("type") or next((kind for kind in PROPERTY_TYPES if kind in prop), None)
+    value = prop.get(kind)
+
+    if kind in ["title", "rich_text"]:
+        return "".join(part.get("text", {}).get("content", "") for part in value or [])
+    if kind == "select":
+        return value.get("name") if value else None
+    if kind == "multi_select":
+        return tuple(option.get("name") for option in value or [])
+    if kind == "date":
+        return value.get("start") if value else None
+    if kind == "files":
+        return tuple((file.get("external") or file.get("file") or {}).get("url") for file in value or [])
+    return value
+
+def cover_url(cover):
+    return (cover or {}).get("external", {}).get("url")
+
+def plan_page_update(payload, current):
+    """
+    Return the part of a page payload that would change something in Notion, or None if nothing would
+
+    Args:
+        payload: The payload built by build_notion_payload
+        current: The page's properties and cover as read from the database, None if unknown
+    """
+    if not current:
+        return payload
+
+    properties = {name: prop for name, prop in payload["properties"].items()
+                  if property_value(prop) != property_value(current["properties"].get(name))}
+    changes = {"properties": properties} if properties else {}
+    if payload["cover"] and cover_url(payload["cover"]) != cover_url(current.get("cover")):
+        changes["cover"] = payload["cover"]
+    return changes or None
+
+def page_key(title, media_type):
+    """
+    Key of a page by title and type, ignoring case, punctuation and spacing, to find pages already in the database
+    """
+    from modules import matching
+    return matching.normalize(title), media_type
+
+def existing_page_keys(headers, database_id=None):
+    """
+    page_key of every page of the database, whatever its status
+    """
+    keys = set()
+    start_cursor = None
+    while True:
+        response = client.post(database_query_url(database_id), headers=headers, json=query_payload(start_cursor))
+        if response.status_code != 200:
+            raise ValueError(f"Error reading the Notion database: {response.status_code} {response.text}")
+        data = response.json()
+        for page in data.get("results", []):
+            properties = page["properties"]
+            keys.add(page_key(property_value(properties.get("Name")), property_value(properties.get("Type"))))
+        if not data.get("has_more"):
+            return keys
+        start_cursor = data["next_cursor"]
+
+def children_url(page_id, start_cursor=None):
+    url = f"https://api.notion.com/v1/blocks/{page_id}/children?page_size=100"
+    return f"{url}&start_cursor={start_cursor}" if start_cursor else url
+
+def image_urls(blocks):
+    return {(block.get("image", {}).get("external") or block.get("image", {}).get("file") or {}).get("url")
+            for block in blocks if block.get("type") == "image"}
+
+def fetch_image_urls(page_id, headers):
+    """
+    Step returning the URLs of every image block of a page, going through all pages of children, or None on error
+    """
+    urls = set()
+    start_cursor = None
+    while True:
+        response = yield Call("GET", children_url(page_id, start_cursor), headers=headers)
+        if response.status_code != 200:
+            print(f"Error retrieving children: {response.text}")
+            return None
+        data = response.json()
+        urls |= image_urls(data.get("results", []))
+        if not data.get("has_more"):
+            return urls
+        start_cursor = data["next_cursor"]
+
+def known_image_urls(page_id):
+    """
+    Image URLs of a page as indexed by a previous run
+    """
+    if cache.mode != "on":
+        return set()
+    return {row[0] for row in state.fetchall("SELECT url FROM page_images WHERE page_id = ?", (page_id,))}
+
+def remember_image_urls(page_id, urls):
+    state.executemany("INSERT OR IGNORE INTO page_images VALUES (?, ?)", [(page_id, url) for url in urls])
+
+def block_url(child):
+    return child["image"]["external"]["url"]
+
+def needs_image_index(img_body, known_urls):
+    return any(block_url(child) not in known_urls for child in img_body["children"])
+
@@ -0,0 +1,101 @@
+# What happens to one Notion entry, shared by both engines: which entries are sent to the workers, what is searched
+# and written for them, and what the journal records along the way
+import time
+
+from modules import journal, metrics, schedule
+from modules.audiovisual import search_movies_and_series
+from modules.book import search_book
+from modules.game import search_game
+from modules.writer import write_page, flag_for_update
+
+
+class Scan:
+    """
+    Counts of the Notion scan of a run, and which of its entries go to the workers
+
+    Entries already written by the run being resumed, entries that aren't due yet (see schedule.is_due) and movies
+    and series unchanged in TMDB (see changes.ChangesFeed) are skipped, the others are journaled as queued.
+    """
+    def __init__(self, feed=None):
+        self.feed      = feed
+        self.start     = time.monotonic()
+        self.found     = 0
+        self.resumed   = 0
+        self.not_due   = 0
+        self.unchanged = 0
+
+    def admit(self, entry):
+        """
+        True if the entry has to be searched and written in this run
+        """
+        self.found += 1
+        if journal.done(entry["page_id"]):
+            self.resumed += 1
+            return False
+        if not schedule.is_due(entry):
+            self.not_due += 1
+            return False
+        if self.feed and self.feed.unchanged(entry):
+            self.unchanged += 1
+            schedule.mark_checked(entry["page_id"])
+            return False
+        journal.mark(entry["page_id"], "queued", entry["title"])
+        return True
+
+    def finish(self, databases_count):
+        metrics.record_stage("scan", time.monotonic() - self.start)
+        metrics.count("found", self.found)
+        metrics.count("resumed", self.resumed)
+        metrics.count("not_due", self.not_due)
+        metrics.count("unchanged", self.unchanged)
+        print(f"Found {self.found} entries in {databases_count} Notion database(s), {self.resumed} already written, "
+              f"{self.not_due} not due yet and {self.unchanged} unchanged in TMDB.")
+
+
+def find(entry):
+    """
+    Step searching an entry in TMDB, books in multiple sources, or games in RAWG/IGDB, returns what was found
+    """
+    search_query = entry["title"]
+    media_type   = entry["type"]
+    if media_type == "Game":
+        return (yield from search_game(search_query, page_id=entry["page_id"]))
+    elif media_type == "Movie" or media_type == "TV Series":
+        return (yield from search_movies_and_series(search_query, media_type, entry["release_date"],
+                                                    entry["page_id"]))
+    elif media_type == "Book":
+        return (yield from search_book(search_query, page_id=entry["page_id"]))
+    print(f"{media_type} not supported.")
+    return None
+
+
+def upload(entry, result):
+    """
+    Step writing the result of an entry's search to its Notion page, or marking the page for update if nothing was
+    found
+    """
+    page_id = entry["page_id"]
+    if not result:
+        journal.mark(page_id, "failed", error="not found")
+        yield from flag_for_update(page_id, entry.get("current"), entry.get("headers"))
+    else:
+        journal.mark(page_id, "fetched")
+        with metrics.timed("write"):
+            written = yield from write_page(result, entry["type"], page_id, entry.get("current"), entry.get("headers"))
+        journal.mark(page_id, "written" if written else "failed", error=None if written else "write failed")
+    schedule.mark_checked(page_id)
+
+
+def failed(entry, error):
+    """
+    Step recording an entry whose search or write raised an error, and marking its page for update so the next run
+    tries it again (the incremental filter, schedule.is_due and the TMDB changes feed never skip pages marked
+    "Update: Yes")
+    """
+    metrics.count("errors")
+    journal.mark(entry["page_id"], "failed", error=str(error))
+    print(f"❌ Error processing '{entry['title']}': {error}")
+    try:
+        yield from flag_for_update(entry["page_id"], entry.get("current"), entry.get("headers"))
+    except Exception as e:
+        print(f"❌ Error marking '{entry['title']}' for update: {e}")
@@ -0,0 +1,119 @@
+# Spaces out the requests sent to a host across every worker, without parking worker threads while waiting
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class PolitenessScheduler:
+    """
+    Hands out request slots for one host, at least min_gap seconds (plus a random jitter) apart
+
+    wait()/wait_async() sleep until the next slot, for callers that run on their own. submit() is for the thread
+    pool: the call is only handed to the executor once its slot comes, so no worker sits idle in the meantime.
+    """
+    def __init__(self, min_gap, jitter=0.0):
+        self.min_gap   = min_gap
+        self.jitter    = jitter
+        self.next_slot = 0.0
+        self.lock      = threading.Lock()
+
+        self._timers  = []
+        self._counter = itertools.count()
+        self._wakeup  = threading.Condition()
+        self._thread  = None
+
+    def reserve(self):
+        """
+        Take the next free slot and return how many seconds away it is
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.min_gap + random.uniform(0, self.jitter)
+            return slot - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        import asyncio
+
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def submit(self, executor, fn, *args):
+        """
+        Run fn(*args) on the executor at the next free slot
+
+        Returns:
+            A future with the result of the call
+        """
+        result = Future()
+
+        def start():
+            try:
+                copy_when_done(executor.submit(fn, *args), result)
+            except Exception as e:
+                result.set_exception(e)
+
+        delay = self.reserve()
+        if delay > 0:
+            self._call_later(delay, start)
+        else:
+            start()
+        return result
+
+    def _call_later(self, delay, fn):
+        with self._wakeup:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._counter), fn))
+            if not self._thread:
+                self._thread = threading.Thread(target=self._dispatch, name="politeness", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def _dispatch(self):
+        # A single thread releases the calls whose slot has come, whatever the number of pending calls
+        while True:
+            with self._wakeup:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    self._wakeup.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                _, _, fn = heapq.heappop(self._timers)
+            fn()
+
+
+def copy_when_done(source, target):
+    def copy(future):
+        try:
+            target.set_result(future.result())
+        except BaseException as e:
+            target.set_exception(e)
+    source.add_done_callback(copy)
+
+
+def then(future, fn, on_error=None):
+    """
+    Future for fn(result of `future`), or on_error(its exception) when it raised and on_error is given, where both may
+    themselves return a future to wait for
+    """
+    result = Future()
+
+    def done(finished):
+        try:
+            error = finished.exception()
+            value = on_error(error) if error is not None and on_error else fn(finished.result())
+        except BaseException as e:
+            result.set_exception(e)
+            return
+        if isinstance(value, Future):
+            copy_when_done(value, result)
+        else:
+            result.set_result(value)
+
+    future.add_done_callback(done)
+    return result
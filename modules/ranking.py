@@ -0,0 +1,81 @@
+# Batched scoring of search results for choose_best_result
+import math
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from modules import matching
+
+MAX_DAYS_DIFF = 1095
+WEIGHTS       = np.array([0.5, 0.3, 0.2])  # Title, release date and popularity
+
+
+@lru_cache(maxsize=16384)
+def parse_day(value):
+    """
+    Day number (with the time of day as a fraction) of a release date, NaN if it can't be parsed
+
+    Accepts "YYYY-MM-DD..." strings and Unix timestamps (IGDB), as int or digit strings. Cached since the same dates
+    come back in every search and every run.
+    """
+    try:
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            date = datetime.fromtimestamp(int(value))
+        else:
+            date = datetime.strptime(str(value)[:10], "%Y-%m-%d")
+    except (ValueError, OverflowError, OSError):
+        return math.nan
+    return date.toordinal() + (date.hour * 3600 + date.minute * 60 + date.second) / 86400
+
+
+def release_date_of(item):
+    return (item.get("release_date") or
+            item.get("first_air_date") or
+            item.get("first_release_date") or
+            item.get("released"))
+
+
+def popularity_of(item):
+    return (item.get("popularity", 0) / 100.0 if item.get("pop")
+            else item.get("total_rating_count") if item.get("total_rating_count")
+            else 0)
+
+
+def score_candidates(results, target_title, target_release_date=None):
+    """
+    Score every result at once, 0.5 * title + 0.3 * release date + 0.2 * popularity
+
+    Same scores as the per-result loop choose_best_result used to run: the title score comes from TitleMatcher, the
+    date score drops linearly to 0 at MAX_DAYS_DIFF days away from the target date, and the popularity is the
+    rating count relative to the most rated result.
+
+    Returns:
+        A NumPy array with one score per result
+    """
+    titles = matching.TitleMatcher(target_title).score_many(
+        [item.get("title", item.get("name", "")) for item in results])
+
+    dates = np.zeros(len(results))
+    if target_release_date:
+        target_day = parse_day(str(target_release_date)[:10])
+        days = np.array([parse_day(date) if date else math.nan for date in map(release_date_of, results)])
+        with np.errstate(invalid="ignore"):
+            days_diff = np.abs(np.floor(days - target_day))
+            dates = np.where(np.isnan(days_diff), 0.0, np.maximum(0.0, 1 - np.minimum(days_diff, MAX_DAYS_DIFF)
+                                                                            / MAX_DAYS_DIFF))
+
+    popularity = np.array([float(popularity_of(item)) for item in results])
+    rating_counts = [item.get("total_rating_count") or 0 for item in results]
+    pop_ratio = max([1, *rating_counts])
+    popularity = np.minimum(1.0, popularity / pop_ratio)
+
+    return np.column_stack([titles, dates, popularity]) @ WEIGHTS
+
+
+def best_result(results, target_title, target_release_date=None):
+    """
+    Return the result with the highest score (the first one on ties, or if every score is 0)
+    """
+    scores = score_candidates(results, target_title, target_release_date)
+    return results[int(np.argmax(scores))]
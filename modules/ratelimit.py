@@ -0,0 +1,102 @@
+# Token buckets keyed by API, shared by both engines through modules/client.py
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from modules import config
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations instead of blocking
+
+    reserve() takes a token (going into debt if there are none left) and returns how long the caller has to wait
+    before using it, so the same bucket works for sleeping threads and for awaiting coroutines.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate     = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens   = self.capacity
+        self.updated  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """
+        Stop handing out free tokens for the next `seconds`, used when the API answers with a Retry-After
+        """
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def wait(self):
+        """
+        Sleep until a token is free, returns the seconds waited
+        """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self):
+        import asyncio
+
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+def api_for_url(url):
+    """
+    Return the name of the API a URL belongs to (e.g. "notion", "tmdb"), or None if it isn't rate limited
+    """
+    return config.API_HOSTS.get(urlsplit(url).netloc)
+
+
+def get_bucket(url, headers=None):
+    """
+    Return the shared token bucket of the API a URL belongs to, or None if it isn't rate limited
+
+    For the APIs in PER_TOKEN_LIMITS, each Authorization header gets its own bucket.
+    """
+    api = api_for_url(url)
+    if api not in config.RATE_LIMITS:
+        return None
+
+    key = (api, (headers or {}).get("Authorization")) if api in config.PER_TOKEN_LIMITS else api
+    bucket = _buckets.get(key)
+    if not bucket:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(key, TokenBucket(config.RATE_LIMITS[api]))
+    return bucket
+
+
+def retry_delay(attempt, headers=None):
+    """
+    Seconds to wait before retry number `attempt` (starting at 0)
+
+    The Retry-After header wins when the API sends one, otherwise it's an exponential backoff with full jitter.
+    """
+    retry_after = (headers or {}).get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), config.BACKOFF_MAX)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                return min(max(seconds, 0.0), config.BACKOFF_MAX)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(config.BACKOFF_MAX, config.BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,56 @@
+# Decides which entries with a non-final status are due, from their air and release dates and their last check
+import time
+from datetime import datetime, timezone
+
+from modules import cache, config, state
+
+state.create_table("""checks (
+                          page_id TEXT PRIMARY KEY,
+                          checked REAL)""")
+
+DATE_PROPERTIES = ["Next air date", "Release date"]
+
+
+def last_checked(page_id):
+    row = state.fetchone("SELECT checked FROM checks WHERE page_id = ?", (page_id,))
+    return row[0] if row else None
+
+def mark_checked(page_id):
+    if page_id:
+        state.execute("INSERT OR REPLACE INTO checks VALUES (?, ?)", (page_id, time.time()))
+
+def day(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat()
+
+def entry_dates(entry):
+    """
+    Days ("YYYY-MM-DD") of the next episode and the release of an entry, as last written to Notion
+    """
+    properties = entry["current"]["properties"]
+    dates = [((properties.get(name) or {}).get("date") or {}).get("start") for name in DATE_PROPERTIES]
+    return [date[:10] for date in dates if date]
+
+def is_due(entry, now=None):
+    """
+    True if an entry has to be searched and written again in this run
+
+    Entries marked "Update: Yes", entries without a status and entries never checked are always due. The others
+    (series still airing, upcoming movies, games and books) are due when their next episode or release date was
+    reached since their last check, or when their last check is older than RECHECK_INTERVAL.
+    """
+    if not config.AIR_DATE_SCHEDULE or cache.mode != "on":
+        return True
+
+    properties = entry["current"]["properties"]
+    update = (properties.get("Update") or {}).get("select") or {}
+    status = (properties.get("Status") or {}).get("select")
+    if update.get("name") == "Yes" or not status:
+        return True
+
+    checked = last_checked(entry["page_id"])
+    now = now or time.time()
+    if checked is None or now - checked >= config.RECHECK_INTERVAL:
+        return True
+
+    # Checked earlier the same day counts, the episode may have aired after the check
+    return any(day(checked) <= date <= day(now) for date in entry_dates(entry))
@@ -0,0 +1,76 @@
+# SQLite file with the state kept between runs (resolved IDs, sync marks...), shared by every module and thread
+import os
+import sqlite3
+import threading
+
+from modules import config
+
+_db = None
+_lock = threading.RLock()
+_schemas = []
+_columns = []
+
+
+def connect():
+    global _db
+    with _lock:
+        if not _db:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            _db = sqlite3.connect(config.STATE_PATH, check_same_thread=False)
+            for schema in _schemas:
+                _db.execute(f"CREATE TABLE IF NOT EXISTS {schema}")
+            for table, column in _columns:
+                _add_column(_db, table, column)
+            _db.commit()
+        return _db
+
+
+def create_table(schema):
+    """
+    Declare a table used by a module, it's only created when the file is first opened
+    """
+    with _lock:
+        _schemas.append(schema)
+        if _db:
+            execute(f"CREATE TABLE IF NOT EXISTS {schema}")
+
+
+def add_column(table, column):
+    """
+    Declare a column added to a table after its first version, state files created before get it when they're opened
+    """
+    with _lock:
+        _columns.append((table, column))
+        if _db:
+            _add_column(_db, table, column)
+            _db.commit()
+
+
+def _add_column(db, table, column):
+    name = column.split()[0]
+    if name not in [row[1] for row in db.execute(f"PRAGMA table_info({table})")]:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+
+def execute(sql, params=()):
+    with _lock:
+        db = connect()
+        db.execute(sql, params)
+        db.commit()
+
+
+def executemany(sql, rows):
+    with _lock:
+        db = connect()
+        db.executemany(sql, rows)
+        db.commit()
+
+
+def fetchone(sql, params=()):
+    with _lock:
+        return connect().execute(sql, params).fetchone()
+
+
+def fetchall(sql, params=()):
+    with _lock:
+        return connect().execute(sql, params).fetchall()
@@ -0,0 +1,126 @@
+# Steps of the pipeline written once for both engines, and how each engine runs them
+#
+# A step is a generator: it yields what it needs done (a request, other steps at the same time, a token, a Goodreads
+# slot or a page to parse) and gets the result back, every decision in between is taken inside the step. run() does
+# the work on the calling thread and run_async() on the event loop, so the engines only differ in how requests are
+# sent. Steps call each other with `yield from`.
+from modules import client, fanout
+
+
+class Call:
+    """
+    An HTTP request, same arguments as client.request, the step gets the response
+    """
+    def __init__(self, method, url, **kwargs):
+        self.method = method
+        self.url    = url
+        self.kwargs = kwargs
+
+
+class All:
+    """
+    Steps run at the same time, the step gets their results in order (None for the ones that failed)
+    """
+    def __init__(self, *steps):
+        self.steps = steps
+
+
+class First:
+    """
+    Steps run at the same time, the step gets the first result that isn't empty (None if they all are)
+    """
+    def __init__(self, *steps):
+        self.steps = steps
+
+
+class Token:
+    """
+    The current token of a tokens.TokenManager, fetched once for every worker when it expired
+    """
+    def __init__(self, manager):
+        self.manager = manager
+
+
+class Slot:
+    """
+    Wait for the next request slot of a politeness.PolitenessScheduler
+    """
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+
+class Offload:
+    """
+    CPU-bound call (parsing a page), run outside of the event loop by the asyncio engine
+    """
+    def __init__(self, fn, *args):
+        self.fn   = fn
+        self.args = args
+
+
+def run(step):
+    """
+    Run a step on the calling thread and return its result
+    """
+    try:
+        need = next(step)
+        while True:
+            try:
+                result = perform(need)
+            except Exception as e:
+                need = step.throw(e)
+            else:
+                need = step.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def perform(need):
+    if isinstance(need, Call):
+        return client.request(need.method, need.url, **need.kwargs)
+    if isinstance(need, All):
+        return fanout.run_all(*[lambda step=step: run(step) for step in need.steps])
+    if isinstance(need, First):
+        return fanout.first_good(*[lambda step=step: run(step) for step in need.steps])
+    if isinstance(need, Token):
+        return need.manager.get()
+    if isinstance(need, Slot):
+        return need.scheduler.wait()
+    if isinstance(need, Offload):
+        return need.fn(*need.args)
+    raise TypeError(f"Unknown step request: {need!r}")
+
+
+async def run_async(http, step):
+    """
+    Run a step on the event loop, sending its requests through the AsyncClient `http`
+    """
+    try:
+        need = next(step)
+        while True:
+            try:
+                result = await perform_async(http, need)
+            except Exception as e:
+                need = step.throw(e)
+            else:
+                need = step.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def perform_async(http, need):
+    import asyncio
+
+    if isinstance(need, Call):
+        return await http.request(need.method, need.url, **need.kwargs)
+    if isinstance(need, All):
+        return await fanout.run_all_async(*[run_async(http, step) for step in need.steps])
+    if isinstance(need, First):
+        return await fanout.first_good_async(*[run_async(http, step) for step in need.steps])
+    if isinstance(need, Token):
+        return await need.manager.get_async(http)
+    if isinstance(need, Slot):
+        return await need.scheduler.wait_async()
+    if isinstance(need, Offload):
+        return await asyncio.to_thread(need.fn, *need.args)
+    raise TypeError(f"Unknown step request: {need!r}")
@@ -0,0 +1,77 @@
+# OAuth tokens shared by every worker and kept in the state store until they expire
+import time
+import threading
+
+from modules import client, config, state
+
+state.create_table("""tokens (
+                          name    TEXT PRIMARY KEY,
+                          token   TEXT,
+                          expires REAL)""")
+
+
+class TokenManager:
+    """
+    Client credentials token of one API, fetched once for every worker and saved with its expiry
+
+    A saved token is reused by later runs until it's within TOKEN_REFRESH_MARGIN seconds of expiring. Only one
+    thread (or task) fetches a new token at a time, the others wait and get the same one. When the API rejects a
+    token, invalidate() drops it so the next get() fetches a new one.
+    """
+    def __init__(self, name, token_url):
+        self.name       = name
+        self.token_url  = token_url
+        self.token      = None
+        self.expires    = 0
+        self.lock       = threading.Lock()
+        self.async_lock = None  # Created by the first get_async, only the asyncio engine needs it
+
+    def valid(self):
+        return self.token and self.expires - config.TOKEN_REFRESH_MARGIN > time.time()
+
+    def load(self):
+        row = state.fetchone("SELECT token, expires FROM tokens WHERE name = ?", (self.name,))
+        if row:
+            self.token, self.expires = row
+        return self.valid()
+
+    def accept(self, response):
+        """
+        Keep and save the token of a token endpoint response
+        """
+        data = response.json()
+        self.token = data.get("access_token")
+        self.expires = time.time() + data.get("expires_in", 0)
+        if self.token:
+            state.execute("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", (self.name, self.token, self.expires))
+        else:
+            print(f"Error getting a {self.name} token: {data}")
+
+    def get(self):
+        if self.valid():
+            return self.token
+        with self.lock:
+            if not self.valid() and not self.load():
+                self.accept(client.post(self.token_url()))
+            return self.token
+
+    async def get_async(self, http):
+        import asyncio
+
+        if self.valid():
+            return self.token
+        if self.async_lock is None:
+            self.async_lock = asyncio.Lock()
+        async with self.async_lock:
+            if not self.valid() and not self.load():
+                self.accept(await http.post(self.token_url()))
+            return self.token
+
+    def invalidate(self, token):
+        """
+        Drop a token the API rejected, unless another worker already replaced it
+        """
+        with self.lock:
+            if self.token == token:
+                self.token, self.expires = None, 0
+                state.execute("DELETE FROM tokens WHERE name = ? AND token = ?", (self.name, token))
@@ -0,0 +1,259 @@
+# Writes the results of the searches to the Notion pages
+import json
+
+from datetime import datetime
+
+from modules import notion, steps
+from modules.steps import Call
+from modules.config import WATCH_REGION, notion_headers, valid_streaming
+
+
+def build_notion_payload(data, media_type):
+    """
+    Convert data to Notion properties without making API calls.
+
+    Args:
+        data: The data from what you want to upload to Notion
+        media_type: The type of the data, e.g., "Book" or "Movie"
+
+    Returns:
+        A (payload, img_body, title, emoji) tuple, with the page payload and the image blocks to append
+    """
+    properties = {"Type": {"select": {"name": media_type}}}
+    title = ""
+    poster = None
+    cover = None
+    emoji = ""
+
+    if media_type == "Game":
+        emoji        = "🕹️"
+        title        = data.get("title", "")
+        developers   = data.get("developers", [])
+        release_date = data.get("release_date", "")
+        cover        = data.get("background", "")
+        poster       = data.get("cover", "")
+        genres       = data.get("genres", [])
+        rating       = data.get("rating", 0)
+        description  = data.get("description", "")
+        year         = release_date[:4] if release_date else ""
+        platforms    = data.get("platforms", "")
+        publishers   = data.get("publishers", [])
+        status       = data.get("status", "")
+
+        # Add game properties
+        properties["Name"]                = {"title": [{"text": {"content": title}}]}
+        properties["Year"]                = {"rich_text": [{"text": {"content": year}}]}
+        properties["Status"]              = {"select": None} if not status else {"select": {"name": status}}
+        properties["Image"]               = {"files": []} if not poster else {"files":[{"type": "external", "name": "Cover","external": {"url": poster}}]}
+        properties["Director/Publisher"]  = {"multi_select": publishers or []}
+        properties["Writer/Developer"]    = {"multi_select": developers}
+        properties["Genre"]               = {"multi_select": genres}
+        properties["Synopsis"]            = {"rich_text": []} if not description else {"rich_text": [{"text": {"content": description[:2000]}}]}
+        properties["Release date"]        = {"date": None} if not release_date else {"date": {"start": release_date}}
+        properties["Global Rating"]       = {"number": round(float(rating), 1)}
+        properties["Update"]              = {"select": {"name": "No"}}
+        properties["Streaming/Platforms"] = {"multi_select": platforms or []}
+
+    if media_type == "TV Series" or media_type == "Movie":
+        emoji = "🎞️" if media_type == "Movie" else "🎬"
+        title = data.get("title") if media_type == "Movie" else data.get("name", "")
+
+        if data.get("poster_path"):
+            cover = f"https://image.tmdb.org/t/p/original{data.get('poster_path')}"
+            poster = f"https://image.tmdb.org/t/p/original{data.get('poster_path')}"
+        if data.get("backdrop_path"):
+            cover = f"https://image.tmdb.org/t/p/original{data.get('backdrop_path')}"
+
+        genres        = data.get("genres", [])
+        status        = data.get("status")
+        synopsis      = data.get("overview")
+        release_date  = data.get("release_date") if media_type == "Movie" else data.get("first_air_date")
+        global_rating = data.get("vote_average", 0)
+        year          = release_date[:4] if release_date else ""
+        credit        = data.get("credits", {})
+        crew          = credit.get("crew", [])
+
+        writers   = []
+        directors = []
+
+        for member in crew:
+            if member.get("job") == "Screenplay" or member.get("job") == "Writer":
+                writers.append({"name": member["name"]})
+            if member.get("job") == "Director":
+                directors.append({"name": member["name"]})
+
+        # Get streaming providers
+        providers_data = data.get("watch/providers", {})
+        streaming = []
+        try:
+            country_data = providers_data["results"].get(WATCH_REGION, {})
+            flatrate = country_data.get("flatrate", [])
+            for provider in flatrate:
+                if provider["provider_name"] in valid_streaming: streaming.append({"name": provider["provider_name"]})
+        except Exception as e:
+            streaming = [{"name": "Not available"}]
+            print(f"Error getting streaming providers: {e}")
+        for d in genres: d.pop('id', None)  # `None` prevents error if the key doesn't exist
+
+        # Add shared properties
+        properties["Update"]              = {"select": {"name": "No"}}
+        properties["Name"]                = {"title": [{"text": {"content": title or ""}}]}
+        properties["Year"]                = {"rich_text": [{"text": {"content": year or ""}}]}
+        properties["Image"]               = {"files": []} if not poster else { "files": [{"type": "external", "name": "Cover", "external": {"url": poster}}]}
+        properties["Status"]              = {"select": None} if not status else {"select": {"name": status}}
+        properties["Genre"]               = {"multi_select": genres or []}
+        properties["Writer/Developer"]    = {"multi_select": writers or []}
+        properties["Director/Publisher"]  = {"multi_select": directors or []}
+        properties["Synopsis"]            = {"rich_text": []} if not synopsis else {"rich_text": [{"text": {"content": synopsis}}]}
+        properties["Streaming/Platforms"] = {"multi_select": streaming or []}
+        properties["Release date"]        = {"date": None} if not release_date else {"date": {"start": release_date}}
+        properties["Global Rating"]       = {"number": round(float(global_rating or 0), 1)}
+
+        # TV Series specific fields
+        if media_type == "TV Series":
+            emoji        = "🎬"
+            episodes     = data.get("number_of_episodes", 0)
+            seasons      = data.get("number_of_seasons", 0)
+            next_episode = data.get("next_episode_to_air", {})
+            last_episode = data.get("last_episode_to_air", {})
+            properties["Seasons"]        = {"number": seasons or 0}
+            properties["Episodes/pages"] = {"number": episodes or 0}
+
+            if last_episode:
+                season           = last_episode.get("season_number", 0)
+                episode          = last_episode.get("episode_number", 0)
+                ep_name          = last_episode.get("name", "")
+                last_episode_str = f"S{season:02}, E{episode:02}: {ep_name}"
+                properties["Last episode"] = {"rich_text": [{"text": {"content": last_episode_str}}]}
+
+            if next_episode:
+                properties["Upcoming episode"] = {"rich_text": [{"text": {"content": next_episode.get("name", "")}}]}
+                properties["Next air date"]    = {"date": {"start": next_episode.get("air_date", "")}}
+
+    if media_type == "Book":
+        emoji        = "📚"
+        title        = data.get("name", "")
+        author       = data.get("writer", [])
+        release_date = data.get("first_publication_year", "")
+        cover        = data.get("cover", "")
+        genres       = data.get("genres", [])
+        rating       = data.get("rating", 0)
+        description  = data.get("summary", "")
+        year         = release_date[-4:] if release_date else ""
+        status       = data.get("is_released", "")
+        pages        = data.get("pages", {})
+
+        genres = [{"name": string} for string in genres]
+        status = "Released" if status else "Upcoming"
+        release_date = datetime.strptime(release_date, "%B %d, %Y")
+        release_date = release_date.strftime("%Y-%m-%d")
+
+        # Add book properties
+        properties["Name"]             = {"title": [{"text": {"content": title}}]}
+        properties["Year"]             = {"rich_text": [{"text": {"content": year}}]}
+        properties["Status"]           = {"select": None} if not status else {"select": {"name": status}}
+        properties["Image"]            = {"files": []} if not cover else {"files":[{"type": "external", "name": "Cover","external": {"url": cover}}]}
+        properties["Writer/Developer"] = {"multi_select": [{"name": author}] or []}
+        properties["Genre"]            = {"multi_select": genres or []}
+        properties["Synopsis"]         = {"rich_text": []} if not description else {"rich_text": [{"text": {"content": description[:2000]}}]}
+        properties["Release date"]     = {"date": {"start": release_date}} if release_date else {"date": None}
+        properties["Global Rating"]    = {"number": round(float(rating*2), 1)}
+        properties["Update"]           = {"select": {"name": "No"}}
+        properties["Episodes/pages"]   = {"number": pages or 0}
+
+    cover = cover if cover else poster if poster else None
+    payload = {"properties": properties,
+               "cover": {"type": "external", "external": {"url": cover}} if cover else None}
+    #--------------------------------------------
+
+
+    img_body = {"children": []}
+    if payload["cover"]:
+        img_body["children"].append({
+            "object": "block",
+            "type": "image",
+            "image": payload["cover"]})
+
+    if poster and cover != poster:
+        img_body["children"].append({
+            "object": "block",
+            "type": "image",
+            "image":{"type": "external", "external": {"url": poster}}})
+
+    return payload, img_body, title, emoji
+
+def remove_existing_images(img_body, existing_urls):
+    """
+    Drop from img_body every image whose URL is already in the page (or earlier in img_body)
+    """
+    seen = set(existing_urls)
+    children = []
+    for child in img_body["children"]:
+        url = notion.block_url(child)
+        if url not in seen:
+            seen.add(url)
+            children.append(child)
+    img_body["children"] = children
+    return img_body
+
+def write_page(data, media_type, page_id, current=None, headers=None):
+    """
+    Step uploading data to an existing Notion page, skipping the calls that wouldn't change anything
+
+    Args:
+        data: The data from what you want to upload to Notion
+        media_type: The type of the data, e.g., "Book" or "Movie"
+        page_id: ID of an existing Notion page to update
+        current: The page's properties and cover as read from the database, if known
+        headers: Notion headers with the token of the page's database, notion_headers by default
+
+    Returns:
+        True if the page is up to date in Notion, False if writing it failed
+    """
+    headers = headers or notion_headers
+    payload, img_body, title, emoji = build_notion_payload(data, media_type)
+
+    # Add images to the page if they don't exist already, only listing the page's blocks when the index of a
+    # previous run doesn't already have every image
+    existing_urls = notion.known_image_urls(page_id)
+    if notion.needs_image_index(img_body, existing_urls):
+        existing_urls = yield from notion.fetch_image_urls(page_id, headers)
+        if existing_urls is None:
+            return False
+        notion.remember_image_urls(page_id, existing_urls)
+    remove_existing_images(img_body, existing_urls)
+
+    # If we have a page ID, update that page
+    if img_body["children"]:
+        update_url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+        response = yield Call("PATCH", update_url, headers=headers, json=img_body)
+        if response.status_code == 200:
+            notion.remember_image_urls(page_id, [notion.block_url(child) for child in img_body["children"]])
+
+    changes = notion.plan_page_update(payload, current)
+    if not changes:
+        print(f"{emoji}✅ '{title}' already up to date.")
+        return True
+    update_url = f"https://api.notion.com/v1/pages/{page_id}"
+    update_response = yield Call("PATCH", update_url, headers=headers, json=changes)
+    if update_response.status_code == 200:
+        print(f"{emoji}🔄 '{title}' updated in Notion.")
+        return True
+    yield from flag_for_update(page_id, headers=headers)
+    print(f"{emoji}❌ Error updating '{title}': {json.dumps(update_response.json(), indent=4)}")
+    return False
+
+def flag_for_update(page_id, current=None, headers=None):
+    """
+    Step marking a page "Update: Yes" (unless current shows it already is), so every later run searches it again
+    """
+    flag = {"properties": {"Update": {"select": {"name": "Yes"}}}, "cover": None}
+    if notion.plan_page_update(flag, current):
+        yield Call("PATCH", f"https://api.notion.com/v1/pages/{page_id}", headers=headers or notion_headers,
+                   json={"properties": flag["properties"]})
+
+def to_notion(data, media_type, page_id, current=None, headers=None):
+    """
+    Same as write_page, on the calling thread
+    """
+    return steps.run(write_page(data, media_type, page_id, current, headers))